@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Shared State Backends
+مخازن مشتركة للجلسات والمهام والملفات لتشغيل عدة نسخ من البوت
+
+The interfaces are deliberately small (get/set/delete, put/claim/extend/ack/fail,
+put/get/delete) so a Redis implementation can be dropped in next to the
+in-process and SQLite ones. Methods are blocking and thread-safe; the bot and
+workers call them through asyncio.to_thread so a busy database never stalls
+the event loop.
+"""
+
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATE_DB = os.getenv('STATE_DB')  # SQLite file shared by front end and workers
+BLOB_DIR = os.getenv('BLOB_DIR')  # Directory (shared volume) for uploaded and intermediate files
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 120))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+# ---------------------------------------------------------------------------
+# Session store
+# ---------------------------------------------------------------------------
+
+class MemorySessionStore:
+    """In-process session store (single instance and tests)"""
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        # Copies mimic a real store: callers must set() to persist changes
+        with self.lock:
+            return copy.deepcopy(self.data.get(key))
+
+    def set(self, key: str, value: Any):
+        with self.lock:
+            self.data[key] = copy.deepcopy(value)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+class SqliteSessionStore:
+    """Session store shared between processes through a SQLite file"""
+
+    def __init__(self, path: str):
+        self.conn = _connect(path)
+        self.lock = threading.Lock()  # one connection shared by the to_thread callers
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM sessions WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+
+    def delete(self, key: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+
+# ---------------------------------------------------------------------------
+# Job queue
+# ---------------------------------------------------------------------------
+# Jobs are leased by a worker and must be acked; the worker extends the lease
+# while it runs the job, and a lease that expires (worker crashed) makes the
+# job claimable again. Jobs sharing a group run one at a
+# time in submission order, which keeps each user's uploads and merges ordered.
+# A job that used up its attempts is logged and deleted.
+
+
+def _log_dropped(job_id: str, payload: Dict[str, Any], attempts: int):
+    logger.error(f"Dropping {payload.get('type')} job {job_id} after {attempts} attempts")
+
+class MemoryJobQueue:
+    """In-process job queue (single instance and tests)"""
+
+    def __init__(self, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.jobs: Dict[str, Dict[str, Any]] = {}  # insertion ordered
+        self.lock = threading.Lock()
+
+    def put(self, payload: Dict[str, Any], group: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                'id': job_id, 'group': group, 'payload': copy.deepcopy(payload),
+                'state': 'pending', 'attempts': 0, 'lease_until': 0.0
+            }
+        return job_id
+
+    def _drop(self, job: Dict[str, Any]):
+        _log_dropped(job['id'], job['payload'], job['attempts'])
+        del self.jobs[job['id']]
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        blocked = set()
+        with self.lock:
+            for job in list(self.jobs.values()):
+                expired = job['state'] == 'leased' and job['lease_until'] <= now
+                if expired and job['attempts'] >= self.max_attempts:
+                    self._drop(job)
+                    continue
+
+                if (job['state'] == 'pending' or expired) and job['group'] not in blocked:
+                    job['state'] = 'leased'
+                    job['attempts'] += 1
+                    job['lease_until'] = now + self.lease_seconds
+                    return {'id': job['id'], 'payload': copy.deepcopy(job['payload']), 'attempts': job['attempts']}
+                if job['group'] is not None:
+                    blocked.add(job['group'])
+        return None
+
+    def extend(self, job_id: str) -> bool:
+        """Renew a leased job's lease; returns False if the job is no longer leased"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != 'leased':
+                return False
+            job['lease_until'] = time.time() + self.lease_seconds
+            return True
+
+    def ack(self, job_id: str):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def fail(self, job_id: str) -> bool:
+        """Release a job after an error; returns True if it will be retried"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            if job['attempts'] >= self.max_attempts:
+                self._drop(job)
+                return False
+            job['state'] = 'pending'
+            return True
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return len(self.jobs)
+
+
+class SqliteJobQueue:
+    """Job queue shared between processes through a SQLite file"""
+
+    def __init__(self, path: str, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = _connect(path)
+        self.lock = threading.Lock()  # one connection shared by the to_thread callers
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " id TEXT UNIQUE NOT NULL,"
+            " grp TEXT,"
+            " payload TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, seq)")
+        # Serves the per-group ordering check in claim() without scanning earlier rows
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_grp ON jobs (grp, seq)")
+        # Older versions kept exhausted jobs around as 'failed'
+        self.conn.execute("DELETE FROM jobs WHERE state = 'failed'")
+
+    def put(self, payload: Dict[str, Any], group: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, grp, payload, state, created) VALUES (?, ?, ?, 'pending', ?)",
+                (job_id, group, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                exhausted = self.conn.execute(
+                    "SELECT id, payload, attempts FROM jobs WHERE state = 'leased' AND lease_until <= ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                ).fetchall()
+                for job_id, payload, attempts in exhausted:
+                    _log_dropped(job_id, json.loads(payload), attempts)
+                    self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+                row = self.conn.execute(
+                    "SELECT j.seq, j.id, j.payload, j.attempts FROM jobs j"
+                    " WHERE (j.state = 'pending' OR (j.state = 'leased' AND j.lease_until <= ?))"
+                    " AND NOT EXISTS (SELECT 1 FROM jobs b WHERE b.grp = j.grp AND b.seq < j.seq)"
+                    " ORDER BY j.seq LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                seq, job_id, payload, attempts = row
+                self.conn.execute(
+                    "UPDATE jobs SET state = 'leased', attempts = ?, lease_until = ? WHERE seq = ?",
+                    (attempts + 1, now + self.lease_seconds, seq)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return {'id': job_id, 'payload': json.loads(payload), 'attempts': attempts + 1}
+
+    def extend(self, job_id: str) -> bool:
+        """Renew a leased job's lease; returns False if the job is no longer leased"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, job_id)
+            )
+        return cursor.rowcount > 0
+
+    def ack(self, job_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: str) -> bool:
+        """Release a job after an error; returns True if it will be retried"""
+        with self.lock:
+            row = self.conn.execute("SELECT payload, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            payload, attempts = row
+            if attempts >= self.max_attempts:
+                _log_dropped(job_id, json.loads(payload), attempts)
+                self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                return False
+            self.conn.execute("UPDATE jobs SET state = 'pending', lease_until = 0 WHERE id = ?", (job_id,))
+            return True
+
+    def pending_count(self) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return row[0]
+
+
+# ---------------------------------------------------------------------------
+# Outbound message queue
+# ---------------------------------------------------------------------------
+# Separate worker processes do not call Telegram themselves: they queue their
+# Bot API calls here and the front end relays them through its DeliveryQueue,
+# so rate limits, flood control and per-chat ordering live in one process.
+# A message is {'chat_id', 'method', 'kwargs'} with JSON-serializable kwargs.
+
+class MemoryMessageQueue:
+    """In-process outbound message queue (single instance and tests)"""
+
+    def __init__(self):
+        self.messages: deque = deque()
+        self.lock = threading.Lock()
+
+    def put_many(self, messages: List[Dict[str, Any]]):
+        with self.lock:
+            self.messages.extend(copy.deepcopy(messages))
+
+    def take(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Remove and return up to `limit` messages in the order they were put"""
+        with self.lock:
+            return [self.messages.popleft() for _ in range(min(limit, len(self.messages)))]
+
+
+class SqliteMessageQueue:
+    """Outbound message queue shared between processes through a SQLite file"""
+
+    def __init__(self, path: str):
+        self.conn = _connect(path)
+        self.lock = threading.Lock()  # one connection shared by the to_thread callers
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbound (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " message TEXT NOT NULL, created REAL NOT NULL)"
+        )
+
+    def put_many(self, messages: List[Dict[str, Any]]):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO outbound (message, created) VALUES (?, ?)",
+                    [(json.dumps(message, ensure_ascii=False), now) for message in messages]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def take(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Remove and return up to `limit` messages in the order they were put"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT seq, message FROM outbound ORDER BY seq LIMIT ?", (limit,)
+                ).fetchall()
+                if rows:
+                    self.conn.execute("DELETE FROM outbound WHERE seq <= ?", (rows[-1][0],))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [json.loads(message) for _, message in rows]
+
+
+# ---------------------------------------------------------------------------
+# Blob store
+# ---------------------------------------------------------------------------
+
+class MemoryBlobStore:
+    """In-process blob store (single instance and tests)"""
+
+    def __init__(self):
+        self.blobs: Dict[str, bytes] = {}
+        self.lock = threading.Lock()
+
+    def put(self, data: bytes, key: Optional[str] = None) -> str:
+        key = key or uuid.uuid4().hex
+        with self.lock:
+            self.blobs[key] = bytes(data)
+        return key
+
+    def get(self, key: str) -> bytes:
+        with self.lock:
+            return self.blobs[key]
+
+    def delete(self, key: str):
+        with self.lock:
+            self.blobs.pop(key, None)
+
+
+class FileBlobStore:
+    """Blob store on a directory, e.g. a volume mounted by every instance"""
+
+    KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        if not self.KEY_PATTERN.match(key) or key.startswith('.'):
+            raise ValueError(f"Invalid blob key: {key}")
+        return os.path.join(self.root, key)
+
+    def put(self, data: bytes, key: Optional[str] = None) -> str:
+        key = key or uuid.uuid4().hex
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return key
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def create_stores() -> Tuple[Any, Any, Any]:
+    """Build (sessions, jobs, blobs) from STATE_DB / BLOB_DIR, falling back to in-process stores"""
+    if STATE_DB:
+        sessions = SqliteSessionStore(STATE_DB)
+        jobs = SqliteJobQueue(STATE_DB)
+    else:
+        sessions = MemorySessionStore()
+        jobs = MemoryJobQueue()
+    blobs = FileBlobStore(BLOB_DIR) if BLOB_DIR else MemoryBlobStore()
+    return sessions, jobs, blobs
+
+
+def create_message_queue():
+    """Outbound message queue on STATE_DB, falling back to an in-process queue"""
+    return SqliteMessageQueue(STATE_DB) if STATE_DB else MemoryMessageQueue()
+
+
+def is_shared() -> bool:
+    """True when state lives outside the process, so front end and workers can be split"""
+    return bool(STATE_DB and BLOB_DIR)
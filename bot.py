@@ -5,13 +5,17 @@ Telegram Bot for HTML Question Extraction
 """
 
 import os
-import json
+import uuid
 import logging
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from parse_html import HTMLResultsParser
+from delivery import DeliveryQueue
+from formats import FORMATS, DEFAULT_FORMAT, available_formats, is_supported_input
+from backends import MemorySessionStore, MemoryJobQueue, MemoryBlobStore, create_stores, create_message_queue, is_shared
+from worker import ParseWorker, session_key, delete_merge_state
+from loop_monitor import monitor, watched
 
 # Configure logging
 logging.basicConfig(
@@ -25,6 +29,12 @@ BOT_TOKEN = os.getenv('BOT_TOKEN', '7936685638:AAEoXoyLbdH6aYpVI6M4WXhCai4_fJ8vs
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable is required")
 
+# 'all' runs a parse worker in this process; 'frontend' leaves parsing to worker.py processes
+BOT_MODE = os.getenv('BOT_MODE', 'all')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # e.g. https://my-bot.onrender.com (polling when unset)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL')  # e.g. http://127.0.0.1:8081 for loadtest.py's fake Bot API
+
 # Categories dictionary
 CATEGORIES = {
     "1": "التناظر اللفظي",
@@ -35,8 +45,35 @@ CATEGORIES = {
 }
 
 class QuestionExtractionBot:
-    def __init__(self):
-        self.user_sessions = {}  # Store user sessions
+    def __init__(self, sessions=None, jobs=None, blobs=None):
+        self.sessions = sessions or MemorySessionStore()  # User sessions and preferences
+        self.jobs = jobs or MemoryJobQueue()  # Parse and merge jobs for the workers
+        self.blobs = blobs or MemoryBlobStore()  # Uploaded files
+        self.outbox = DeliveryQueue()  # Rate-limited outgoing messages
+    
+    # Store calls may block on a shared database, so they run off the event loop
+    async def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.sessions.get, session_key(user_id))
+    
+    async def set_session(self, user_id: int, session: Dict[str, Any]):
+        await asyncio.to_thread(self.sessions.set, session_key(user_id), session)
+    
+    async def get_format(self, user_id: int) -> str:
+        return await asyncio.to_thread(self.sessions.get, f"format:{user_id}") or DEFAULT_FORMAT
+    
+    async def put_job(self, payload: Dict[str, Any], user_id: int):
+        # One group per user keeps that user's jobs in order
+        await asyncio.to_thread(self.jobs.put, payload, str(user_id))
+    
+    def reply(self, update: Update, text: str, reply_markup=None):
+        """Queue a new message to the chat an update came from"""
+        self.outbox.send_message(update.effective_chat.id, text, reply_markup=reply_markup)
+    
+    def edit_text(self, query, text: str, reply_markup=None):
+        """Queue an edit of the message a callback query came from"""
+        self.outbox.edit_message_text(
+            query.message.chat_id, query.message.message_id, text, reply_markup=reply_markup
+        )
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start command handler"""
@@ -52,11 +89,12 @@ class QuestionExtractionBot:
         keyboard = [
             [InlineKeyboardButton("📄 استخراج من HTML", callback_data="extract_html")],
             [InlineKeyboardButton("🔗 دمج ملفات JSON", callback_data="merge_files")],
+            [InlineKeyboardButton("⚙️ صيغة الإخراج", callback_data="choose_format")],
             [InlineKeyboardButton("❓ مساعدة", callback_data="help")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(welcome_text, reply_markup=reply_markup)
+        self.reply(update, welcome_text, reply_markup=reply_markup)
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Help command handler"""
@@ -73,6 +111,10 @@ class QuestionExtractionBot:
 2️⃣ اختر الملفات المراد دمجها
 3️⃣ احصل على ملف JSON موحد ومرتب
 
+⚙️ صيغة الإخراج:
+استخدم /format لاختيار صيغة الملف (JSON منسق، JSON مضغوط، JSON Lines، gzip، zstd، MessagePack)
+يمكن دمج الملفات بأي من هذه الصيغ
+
 📝 الأقسام المدعومة:
 • التناظر اللفظي
 • إكمال الجمل
@@ -80,7 +122,7 @@ class QuestionExtractionBot:
 • الخطأ السياقي
 • المفردة الشاذة
         """
-        await update.message.reply_text(help_text)
+        self.reply(update, help_text)
     
     async def handle_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle main menu selections"""
@@ -89,29 +131,69 @@ class QuestionExtractionBot:
             await query.answer()
             
             if query.data == "extract_html":
-                await query.edit_message_text(
-                    "📄 أرسل ملف HTML لبدء الاستخراج",
-                    reply_markup=None
-                )
+                self.edit_text(query, "📄 أرسل ملف HTML لبدء الاستخراج")
             elif query.data == "merge_files":
                 await self.start_merge_process(update, context)
+            elif query.data == "choose_format":
+                await self.format_command(update, context)
             elif query.data == "help":
                 await self.help_command(update, context)
                 
         except Exception as e:
             logger.error(f"Error handling main menu: {e}")
-            await query.edit_message_text("❌ حدث خطأ في معالجة الطلب")
+            self.edit_text(query, "❌ حدث خطأ في معالجة الطلب")
+    
+    async def format_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show output format selection"""
+        user_id = update.effective_user.id
+        current = await self.get_format(user_id)
+        
+        keyboard = []
+        for name in available_formats():
+            label = FORMATS[name]['label']
+            if name == current:
+                label = f"✅ {label}"
+            keyboard.append([InlineKeyboardButton(label, callback_data=f"fmt_{name}")])
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        text = "⚙️ اختر صيغة ملف الإخراج:"
+        if update.callback_query:
+            self.edit_text(update.callback_query, text, reply_markup=reply_markup)
+        else:
+            self.reply(update, text, reply_markup=reply_markup)
+    
+    async def handle_format_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle output format selection"""
+        try:
+            query = update.callback_query
+            await query.answer()
+            
+            user_id = update.effective_user.id
+            fmt = query.data[len('fmt_'):]
+            
+            if fmt not in available_formats():
+                self.edit_text(query, "❌ هذه الصيغة غير متاحة حالياً")
+                return
+            
+            await asyncio.to_thread(self.sessions.set, f"format:{user_id}", fmt)
+            self.edit_text(query, f"✅ تم اختيار صيغة الإخراج: {FORMATS[fmt]['label']}")
+            
+        except Exception as e:
+            logger.error(f"Error handling format selection: {e}")
+            self.edit_text(query, "❌ حدث خطأ في اختيار الصيغة")
     
     async def start_merge_process(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start the merge files process"""
         user_id = update.effective_user.id
         
-        # Initialize merge session
-        self.user_sessions[user_id] = {
+        # Drop any previous session before starting a new merge
+        await self.cleanup_session(user_id)
+        
+        # Initialize merge session; uploads are folded in by the workers
+        await self.set_session(user_id, {
             'mode': 'merge',
-            'files': [],
-            'file_paths': []
-        }
+            'merge_id': uuid.uuid4().hex
+        })
         
         text = """
 🔗 دمج ملفات JSON
@@ -128,7 +210,7 @@ class QuestionExtractionBot:
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+        self.edit_text(update.callback_query, text, reply_markup=reply_markup)
     
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle file uploads (HTML or JSON)"""
@@ -138,37 +220,38 @@ class QuestionExtractionBot:
             file_extension = document.file_name.lower().split('.')[-1]
             
             # Check if user is in merge mode
-            if user_id in self.user_sessions and self.user_sessions[user_id].get('mode') == 'merge':
-                if file_extension == 'json':
+            session = await self.get_session(user_id)
+            if session and session.get('mode') == 'merge':
+                if is_supported_input(document.file_name):
                     await self.handle_json_upload(update, context)
                 else:
-                    await update.message.reply_text("❌ في وضع الدمج، يرجى إرسال ملفات JSON فقط")
+                    self.reply(update, "❌ في وضع الدمج، يرجى إرسال ملفات JSON فقط (json, jsonl, gz, zst, msgpack)")
                 return
             
             # Check if file is HTML for extraction mode
             if file_extension != 'html':
-                await update.message.reply_text("❌ يرجى إرسال ملف HTML فقط")
+                self.reply(update, "❌ يرجى إرسال ملف HTML فقط")
                 return
             
-            # Download file
+            # Download file into the shared blob store
             file = await context.bot.get_file(document.file_id)
-            file_path = f"temp_{user_id}_{document.file_name}"
-            
-            await file.download_to_drive(file_path)
+            data = await file.download_as_bytearray()
+            blob_key = await asyncio.to_thread(self.blobs.put, bytes(data))
             
-            # Store file info in user session
-            self.user_sessions[user_id] = {
-                'file_path': file_path,
+            # Replace any previous upload and store file info in user session
+            await self.cleanup_session(user_id)
+            await self.set_session(user_id, {
+                'blob_key': blob_key,
                 'file_name': document.file_name,
                 'mode': 'extract'
-            }
+            })
             
             # Show category selection
             await self.show_category_selection(update, context)
             
         except Exception as e:
             logger.error(f"Error handling document: {e}")
-            await update.message.reply_text("❌ حدث خطأ في معالجة الملف")
+            self.reply(update, "❌ حدث خطأ في معالجة الملف")
     
     async def handle_json_upload(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle JSON file uploads for merging"""
@@ -176,28 +259,27 @@ class QuestionExtractionBot:
             user_id = update.effective_user.id
             document = update.message.document
             
-            # Download file
-            file = await context.bot.get_file(document.file_id)
-            file_path = f"temp_{user_id}_{document.file_name}"
-            
-            await file.download_to_drive(file_path)
-            
-            # Add to merge session
-            if user_id in self.user_sessions and self.user_sessions[user_id].get('mode') == 'merge':
-                self.user_sessions[user_id]['files'].append(document.file_name)
-                self.user_sessions[user_id]['file_paths'].append(file_path)
+            session = await self.get_session(user_id)
+            if session and session.get('mode') == 'merge':
+                # Download file into the shared blob store
+                file = await context.bot.get_file(document.file_id)
+                data = await file.download_as_bytearray()
+                blob_key = await asyncio.to_thread(self.blobs.put, bytes(data))
                 
-                files_count = len(self.user_sessions[user_id]['files'])
-                await update.message.reply_text(
-                    f"✅ تم إضافة الملف: {document.file_name}\n"
-                    f"📊 إجمالي الملفات: {files_count}"
-                )
+                # A worker parses it and folds it into the merge right away
+                await self.put_job({
+                    'type': 'merge_file',
+                    'chat_id': user_id,
+                    'merge_id': session['merge_id'],
+                    'blob_key': blob_key,
+                    'file_name': document.file_name
+                }, user_id)
             else:
-                await update.message.reply_text("❌ يرجى البدء بعملية الدمج أولاً")
+                self.reply(update, "❌ يرجى البدء بعملية الدمج أولاً")
                 
         except Exception as e:
             logger.error(f"Error handling JSON upload: {e}")
-            await update.message.reply_text("❌ حدث خطأ في معالجة الملف")
+            self.reply(update, "❌ حدث خطأ في معالجة الملف")
     
     async def show_category_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show category selection keyboard"""
@@ -217,8 +299,9 @@ class QuestionExtractionBot:
 5️⃣ المفردة الشاذة
         """
         
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        self.reply(update, text, reply_markup=reply_markup)
     
+    @watched
     async def handle_category_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle category selection"""
         try:
@@ -229,62 +312,33 @@ class QuestionExtractionBot:
             category_key = query.data.split('_')[1]
             category = CATEGORIES[category_key]
             
-            if user_id not in self.user_sessions:
-                await query.edit_message_text("❌ انتهت صلاحية الجلسة. يرجى إرسال الملف مرة أخرى")
+            session = await self.get_session(user_id)
+            if not session or session.get('mode') != 'extract':
+                self.edit_text(query, "❌ انتهت صلاحية الجلسة. يرجى إرسال الملف مرة أخرى")
                 return
             
             # Show processing message
-            await query.edit_message_text("⏳ جاري معالجة الملف...")
-            
-            # Process the file
-            file_info = self.user_sessions[user_id]
-            file_path = file_info['file_path']
-            file_name = file_info['file_name']
-            
-            # Create new parser instance for each file to avoid merging
-            parser = HTMLResultsParser()
-            questions = parser.parse_html_file(file_path, category)
-            
-            if not questions:
-                await query.edit_message_text("❌ لم يتم العثور على أسئلة في الملف")
-                return
-            
-            # Generate output filename
-            output_filename = file_name.replace('.html', '.json')
-            
-            # Save questions to JSON
-            output_path = f"output_{user_id}_{output_filename}"
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(questions, f, ensure_ascii=False, indent=2)
-            
-            # Send results
-            result_text = f"""
-✅ تم استخراج الأسئلة بنجاح!
-
-📊 إحصائيات:
-• عدد الأسئلة: {len(questions)}
-• نوع القسم: {category}
-• اسم الملف: {output_filename}
-            """
-            
-            await query.edit_message_text(result_text)
-            
-            # Send JSON file
-            with open(output_path, 'rb') as f:
-                await context.bot.send_document(
-                    chat_id=user_id,
-                    document=f,
-                    filename=output_filename,
-                    caption=f"📄 ملف الأسئلة المستخرجة - {category}"
-                )
-            
-            # Clean up temporary files
-            self.cleanup_files(user_id)
+            self.edit_text(query, "⏳ جاري معالجة الملف...")
+            
+            # Hand the file to a parse worker
+            await self.put_job({
+                'type': 'extract',
+                'chat_id': user_id,
+                'message_id': query.message.message_id,
+                'blob_key': session['blob_key'],
+                'file_name': session['file_name'],
+                'category': category,
+                'format': await self.get_format(user_id)
+            }, user_id)
+            
+            # The worker owns the uploaded file from here on
+            await asyncio.to_thread(self.sessions.delete, session_key(user_id))
             
         except Exception as e:
             logger.error(f"Error processing category selection: {e}")
-            await query.edit_message_text("❌ حدث خطأ في معالجة الملف")
+            self.edit_text(query, "❌ حدث خطأ في معالجة الملف")
     
+    @watched
     async def execute_merge(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Execute the merge process"""
         try:
@@ -293,65 +347,26 @@ class QuestionExtractionBot:
             
             user_id = update.effective_user.id
             
-            if user_id not in self.user_sessions or self.user_sessions[user_id].get('mode') != 'merge':
-                await query.edit_message_text("❌ لا توجد جلسة دمج نشطة")
-                return
-            
-            files = self.user_sessions[user_id].get('files', [])
-            file_paths = self.user_sessions[user_id].get('file_paths', [])
-            
-            if len(files) < 2:
-                await query.edit_message_text("❌ تحتاج إلى ملفين JSON على الأقل للدمج")
+            session = await self.get_session(user_id)
+            if not session or session.get('mode') != 'merge':
+                self.edit_text(query, "❌ لا توجد جلسة دمج نشطة")
                 return
             
             # Show processing message
-            await query.edit_message_text("⏳ جاري دمج الملفات...")
-            
-            # Merge files
-            merged_questions = await self.merge_json_files(file_paths)
-            
-            if not merged_questions:
-                await query.edit_message_text("❌ فشل في دمج الملفات")
-                return
-            
-            # Generate output filename
-            output_filename = f"merged_questions_{len(merged_questions)}_questions.json"
-            
-            # Save merged questions to JSON
-            output_path = f"output_{user_id}_{output_filename}"
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(merged_questions, f, ensure_ascii=False, indent=2)
+            self.edit_text(query, "⏳ جاري دمج الملفات...")
             
-            # Send results
-            result_text = f"""
-✅ تم دمج الملفات بنجاح!
-
-📊 إحصائيات:
-• عدد الملفات المدمجة: {len(files)}
-• إجمالي الأسئلة: {len(merged_questions)}
-• اسم الملف: {output_filename}
-
-📝 الملفات المدمجة:
-{chr(10).join([f"• {file}" for file in files])}
-            """
-            
-            await query.edit_message_text(result_text)
-            
-            # Send merged JSON file
-            with open(output_path, 'rb') as f:
-                await context.bot.send_document(
-                    chat_id=user_id,
-                    document=f,
-                    filename=output_filename,
-                    caption=f"📄 ملف الأسئلة المدمجة - {len(merged_questions)} سؤال"
-                )
-            
-            # Clean up temporary files
-            self.cleanup_merge_files(user_id)
+            # Queued behind this user's uploads, so every file is folded in first
+            await self.put_job({
+                'type': 'merge_finalize',
+                'chat_id': user_id,
+                'message_id': query.message.message_id,
+                'merge_id': session['merge_id'],
+                'format': await self.get_format(user_id)
+            }, user_id)
             
         except Exception as e:
             logger.error(f"Error executing merge: {e}")
-            await query.edit_message_text("❌ حدث خطأ في دمج الملفات")
+            self.edit_text(query, "❌ حدث خطأ في دمج الملفات")
     
     async def cancel_merge(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancel merge process"""
@@ -361,117 +376,95 @@ class QuestionExtractionBot:
             
             user_id = update.effective_user.id
             
-            if user_id in self.user_sessions and self.user_sessions[user_id].get('mode') == 'merge':
-                self.cleanup_merge_files(user_id)
+            session = await self.get_session(user_id)
+            if session and session.get('mode') == 'merge':
+                await self.cleanup_session(user_id)
             
-            await query.edit_message_text("❌ تم إلغاء عملية الدمج")
+            self.edit_text(query, "❌ تم إلغاء عملية الدمج")
             
         except Exception as e:
             logger.error(f"Error canceling merge: {e}")
-            await query.edit_message_text("❌ حدث خطأ في إلغاء العملية")
+            self.edit_text(query, "❌ حدث خطأ في إلغاء العملية")
     
-    async def merge_json_files(self, file_paths: list) -> list:
-        """Merge multiple JSON files and renumber questions"""
+    async def cleanup_session(self, user_id: int):
+        """Clean up the user's session and the files it owns"""
         try:
-            all_questions = []
-            question_number = 1
-            
-            for file_path in file_paths:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        questions = json.load(f)
-                    
-                    # Ensure questions is a list
-                    if not isinstance(questions, list):
-                        questions = [questions] if questions else []
-                    
-                    # Renumber questions and add to merged list
-                    for question in questions:
-                        if isinstance(question, dict) and 'question' in question:
-                            question_copy = question.copy()
-                            question_copy['question_number'] = question_number
-                            all_questions.append(question_copy)
-                            question_number += 1
-                            
-                except Exception as e:
-                    logger.error(f"Error reading file {file_path}: {e}")
-                    continue
-            
-            return all_questions
-            
-        except Exception as e:
-            logger.error(f"Error merging JSON files: {e}")
-            return []
-    
-    def cleanup_merge_files(self, user_id: int):
-        """Clean up merge session files"""
-        try:
-            if user_id in self.user_sessions and self.user_sessions[user_id].get('mode') == 'merge':
-                # Clean up individual files
-                for file_path in self.user_sessions[user_id].get('file_paths', []):
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                
-                # Clean up output file
-                files_count = len(self.user_sessions[user_id].get('files', []))
-                output_path = f"output_{user_id}_merged_questions_{files_count}_questions.json"
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                
-                del self.user_sessions[user_id]
+            await asyncio.to_thread(self.drop_session, user_id)
         except Exception as e:
-            logger.error(f"Error cleaning up merge files: {e}")
+            logger.error(f"Error cleaning up session: {e}")
     
-    def cleanup_files(self, user_id: int):
-        """Clean up temporary files"""
-        try:
-            if user_id in self.user_sessions:
-                file_path = self.user_sessions[user_id]['file_path']
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                
-                output_path = f"output_{user_id}_{self.user_sessions[user_id]['file_name'].replace('.html', '.json')}"
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                
-                del self.user_sessions[user_id]
-        except Exception as e:
-            logger.error(f"Error cleaning up files: {e}")
+    def drop_session(self, user_id: int):
+        session = self.sessions.get(session_key(user_id))
+        if not session:
+            return
+        
+        if session.get('mode') == 'merge':
+            # Pending uploads are dropped by the workers once the session is gone
+            delete_merge_state(self.blobs, session['merge_id'])
+        elif session.get('blob_key'):
+            self.blobs.delete(session['blob_key'])
+        
+        self.sessions.delete(session_key(user_id))
 
 async def web_server():
     """Simple web server to keep the port alive"""
     from aiohttp import web
     
-    async def health_check(request):
+    async def root(request):
         return web.Response(text="Bot is running!", status=200)
     
+    async def health_check(request):
+        # 503 lets the platform restart an instance whose event loop keeps stalling
+        health = monitor.health()
+        return web.json_response(health, status=200 if health['status'] == 'ok' else 503)
+    
     app = web.Application()
-    app.router.add_get('/', health_check)
+    app.router.add_get('/', root)
     app.router.add_get('/health', health_check)
     
     port = int(os.getenv('PORT', 8000))
     return app, port
 
-def main():
-    """Main function to run the bot"""
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN not found in environment variables")
-        return
-    
-    # Create bot instance
-    bot = QuestionExtractionBot()
-    
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+def build_application(bot: QuestionExtractionBot, token: str = BOT_TOKEN,
+                      base_url: Optional[str] = BOT_API_BASE_URL) -> Application:
+    """Create the telegram Application with every handler registered"""
+    builder = Application.builder().token(token)
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
     
     # Add handlers
     application.add_handler(CommandHandler("start", bot.start))
     application.add_handler(CommandHandler("help", bot.help_command))
+    application.add_handler(CommandHandler("format", bot.format_command))
     application.add_handler(MessageHandler(filters.Document.ALL, bot.handle_document))
     application.add_handler(CallbackQueryHandler(bot.handle_category_selection, pattern="^cat_"))
-    application.add_handler(CallbackQueryHandler(bot.handle_main_menu, pattern="^(extract_html|merge_files|help)$"))
+    application.add_handler(CallbackQueryHandler(bot.handle_format_selection, pattern="^fmt_"))
+    application.add_handler(CallbackQueryHandler(bot.handle_main_menu, pattern="^(extract_html|merge_files|choose_format|help)$"))
     application.add_handler(CallbackQueryHandler(bot.execute_merge, pattern="^execute_merge$"))
     application.add_handler(CallbackQueryHandler(bot.cancel_merge, pattern="^cancel_merge$"))
+    return application
+
+def main():
+    """Main function to run the bot"""
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN not found in environment variables")
+        return
+    
+    if BOT_MODE not in ('all', 'frontend'):
+        logger.error(f"Unknown BOT_MODE: {BOT_MODE}")
+        return
+    
+    if BOT_MODE == 'frontend' and not is_shared():
+        logger.error("BOT_MODE=frontend requires STATE_DB and BLOB_DIR shared with the workers")
+        return
+    
+    # Create bot instance on the configured stores
+    sessions, jobs, blobs = create_stores()
+    bot = QuestionExtractionBot(sessions, jobs, blobs)
+    
+    # Create application
+    application = build_application(bot)
     
     # Start the bot and web server
     logger.info("Starting bot...")
@@ -479,8 +472,22 @@ def main():
     async def run_bot_and_server():
         from aiohttp import web
         
+        # Measure event-loop lag and log handlers that block it
+        monitor.start()
+        
         # Start web server
         app, port = await web_server()
+        
+        async def telegram_webhook(request):
+            if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+                return web.Response(status=403)
+            update = Update.de_json(await request.json(), application.bot)
+            await application.update_queue.put(update)
+            return web.Response()
+        
+        if WEBHOOK_URL:
+            app.router.add_post('/telegram', telegram_webhook)
+        
         runner = web.AppRunner(app)
         await runner.setup()
         site = web.TCPSite(runner, '0.0.0.0', port)
@@ -489,8 +496,24 @@ def main():
         
         # Start bot
         await application.initialize()
+        bot.outbox.start(application.bot)
         await application.start()
-        await application.updater.start_polling()
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(f"{WEBHOOK_URL}/telegram", secret_token=WEBHOOK_SECRET)
+            logger.info(f"Receiving updates via webhook at {WEBHOOK_URL}/telegram")
+        else:
+            await application.updater.start_polling()
+        
+        # Parse in this process unless separate workers are deployed
+        worker_task = None
+        if BOT_MODE == 'all':
+            worker = ParseWorker(jobs, sessions, blobs, bot.outbox)
+            worker_task = asyncio.create_task(worker.run())
+        
+        # Separate workers queue their messages; this process is the only one sending
+        relay_task = None
+        if is_shared():
+            relay_task = asyncio.create_task(bot.outbox.relay(create_message_queue(), blobs))
         
         # Keep running
         try:
@@ -498,10 +521,17 @@ def main():
         except KeyboardInterrupt:
             logger.info("Shutting down...")
         finally:
-            await application.updater.stop()
+            for task in (worker_task, relay_task):
+                if task is not None:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+            if application.updater.running:
+                await application.updater.stop()
             await application.stop()
+            await bot.outbox.stop()
             await application.shutdown()
             await runner.cleanup()
+            await monitor.stop()
     
     # Run the bot and web server
     asyncio.run(run_bot_and_server())
@@ -0,0 +1,2 @@
+# test_bot.py launches the production bot, it is not a pytest module
+collect_ignore = ["test_bot.py"]
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Outbound Delivery Queue
+طابور الإرسال إلى تليجرام مع التحكم في معدل الإرسال
+"""
+
+import os
+import time
+import logging
+import asyncio
+from collections import deque
+from typing import List, Dict, Any, Optional, Deque
+from telegram.error import RetryAfter, BadRequest, Forbidden, NetworkError
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second overall and about one per second per chat
+GLOBAL_RATE = float(os.getenv('DELIVERY_GLOBAL_RATE', 30))
+CHAT_RATE = float(os.getenv('DELIVERY_CHAT_RATE', 1))
+CHAT_BURST = float(os.getenv('DELIVERY_CHAT_BURST', 3))
+MAX_RETRIES = 5
+FLOOD_WINDOW = 1.0  # seconds in which 429s for different chats count as bot-wide flood control
+RELAY_INTERVAL = float(os.getenv('DELIVERY_RELAY_INTERVAL', 0.1))  # seconds between polls of the shared queue
+RELAYED_METHODS = ('send_message', 'edit_message_text', 'send_document')
+
+
+class TokenBucket:
+    """Token bucket used to pace outgoing Bot API calls"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds to wait before a token is available"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self) -> bool:
+        """Full and not blocked, so a fresh bucket would behave the same"""
+        return self.delay() <= 0 and self.tokens >= self.capacity
+
+    def block(self, seconds: float):
+        """Stop handing out tokens for the given number of seconds (flood control)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Wait for a token and consume it; waiters are served one at a time in arrival order"""
+        # Only the waiter holding the lock sleeps on the bucket, so a token wakes one task, not all of them
+        async with self.lock:
+            while True:
+                wait = self.delay()
+                if wait <= 0:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(wait)
+
+
+class DeliveryQueue:
+    """Queue outgoing messages per chat and deliver them within Telegram's rate limits"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: float = CHAT_BURST, max_retries: int = MAX_RETRIES):
+        self.bot = None
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.recent_floods: Dict[int, float] = {}  # chat_id -> time of its last 429
+        self.pending: Dict[int, Deque[Dict[str, Any]]] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+
+    def start(self, bot):
+        """Attach the bot used for delivery (telegram.Bot or a compatible fake)"""
+        self.bot = bot
+
+    async def stop(self, timeout: float = 30):
+        """Wait for queued messages to be delivered"""
+        workers = list(self.workers.values())
+        if workers:
+            done, not_done = await asyncio.wait(workers, timeout=timeout)
+            for task in not_done:
+                task.cancel()
+            if not_done:
+                logger.warning(f"Dropped pending deliveries for {len(not_done)} chats on shutdown")
+
+    def enqueue(self, chat_id: int, method: str, key: Optional[Any] = None, **kwargs):
+        """Queue a Bot API call; consecutive calls with the same key are coalesced"""
+        queue = self.pending.setdefault(chat_id, deque())
+        if key is not None and queue and queue[-1]['key'] == key:
+            # Only the latest text of a progress message is worth sending
+            queue[-1]['kwargs'] = kwargs
+        else:
+            queue.append({'method': method, 'key': key, 'kwargs': kwargs})
+
+        if chat_id not in self.workers:
+            self.workers[chat_id] = asyncio.create_task(self._run_chat(chat_id))
+
+    def send_message(self, chat_id: int, text: str, reply_markup=None):
+        self.enqueue(chat_id, 'send_message', text=text, reply_markup=reply_markup)
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, reply_markup=None):
+        self.enqueue(chat_id, 'edit_message_text', key=('edit', message_id),
+                     message_id=message_id, text=text, reply_markup=reply_markup)
+
+    def send_document(self, chat_id: int, document: bytes, filename: str, caption: Optional[str] = None):
+        self.enqueue(chat_id, 'send_document', document=document, filename=filename, caption=caption)
+
+    async def flush(self):
+        """Calls are handed to the per-chat tasks as they are queued, so there is nothing to flush"""
+
+    async def relay(self, messages, blobs, poll_interval: float = RELAY_INTERVAL):
+        """Deliver the calls separate worker processes put on the shared message queue (front end only)"""
+        while True:
+            try:
+                batch = await asyncio.to_thread(messages.take)
+            except Exception as e:
+                logger.error(f"Error reading the outbound message queue: {e}")
+                batch = []
+
+            for message in batch:
+                method, kwargs = message['method'], dict(message['kwargs'])
+                if method not in RELAYED_METHODS:
+                    logger.error(f"Unknown relayed method: {method}")
+                    continue
+                if 'document_blob' in kwargs:
+                    key = kwargs.pop('document_blob')
+                    try:
+                        kwargs['document'] = await asyncio.to_thread(blobs.get, key)
+                    except KeyError:
+                        logger.error(f"Document {key} for chat {message['chat_id']} is missing")
+                        continue
+                    await asyncio.to_thread(blobs.delete, key)
+                getattr(self, method)(message['chat_id'], **kwargs)
+
+            if not batch:
+                await asyncio.sleep(poll_interval)
+
+    def queued_count(self) -> int:
+        return sum(len(queue) for queue in self.pending.values())
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _run_chat(self, chat_id: int):
+        """Deliver queued calls of a single chat in order"""
+        queue = self.pending[chat_id]
+        bucket = self._chat_bucket(chat_id)
+        try:
+            while queue:
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                # Pop only now so edits queued while waiting can still be coalesced
+                job = queue.popleft()
+                try:
+                    await self._deliver(chat_id, job, bucket)
+                except Exception as e:
+                    logger.error(f"Error delivering {job['method']} to chat {chat_id}: {e}")
+        finally:
+            del self.workers[chat_id]
+            del self.pending[chat_id]
+            self._prune_chat_buckets()
+
+    def _prune_chat_buckets(self):
+        """Forget the buckets of chats with nothing queued once they refilled, so the dict does not grow forever"""
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            if chat_id not in self.workers and bucket.is_idle():
+                del self.chat_buckets[chat_id]
+
+    def _is_bot_wide_flood(self, chat_id: int, chat_idle: bool) -> bool:
+        """Record a 429 for the chat; True when it is not chat-specific or other chats just got one too"""
+        now = time.monotonic()
+        self.recent_floods = {chat: at for chat, at in self.recent_floods.items() if now - at < FLOOD_WINDOW}
+        others = any(chat != chat_id for chat in self.recent_floods)
+        self.recent_floods[chat_id] = now
+        return chat_idle or others
+
+    async def _deliver(self, chat_id: int, job: Dict[str, Any], bucket: TokenBucket):
+        """Perform one Bot API call, honouring flood control and retrying network errors"""
+        if self.bot is None:
+            raise RuntimeError("DeliveryQueue.start() was not called")
+
+        method = getattr(self.bot, job['method'])
+        failures = 0
+        while True:
+            # A chat that had not used its burst cannot have hit the per-chat limit
+            chat_idle = bucket.tokens >= bucket.capacity - 1
+            try:
+                await method(chat_id=chat_id, **job['kwargs'])
+                return
+            except RetryAfter as e:
+                retry_after = float(e.retry_after)
+                bucket.block(retry_after)
+                if self._is_bot_wide_flood(chat_id, chat_idle):
+                    logger.warning(f"Bot-wide flood control, pausing all chats for {retry_after}s")
+                    self.global_bucket.block(retry_after)
+                else:
+                    logger.warning(f"Flood control on chat {chat_id}, retrying {job['method']} in {retry_after}s")
+                await asyncio.sleep(retry_after)
+            except BadRequest as e:
+                if 'message is not modified' not in str(e).lower():
+                    logger.error(f"Bad request for {job['method']} to chat {chat_id}: {e}")
+                return
+            except Forbidden as e:
+                logger.warning(f"Cannot deliver to chat {chat_id}: {e}")
+                return
+            except NetworkError as e:
+                failures += 1
+                if failures > self.max_retries:
+                    logger.error(f"Giving up on {job['method']} to chat {chat_id}: {e}")
+                    return
+                await asyncio.sleep(min(2 ** failures, 30))
+
+
+class StoredOutbox:
+    """Outbox of a separate worker process, with the DeliveryQueue calls a worker uses
+
+    Calls are written in order to the shared message queue (documents go to the
+    blob store) and the front end's DeliveryQueue.relay() sends them.
+    """
+
+    def __init__(self, messages, blobs):
+        self.messages = messages
+        self.blobs = blobs
+        self.buffer: Deque[Dict[str, Any]] = deque()
+        self.writer: Optional[asyncio.Task] = None
+
+    def enqueue(self, chat_id: int, method: str, **kwargs):
+        self.buffer.append({'chat_id': chat_id, 'method': method, 'kwargs': kwargs})
+        # One writer at a time keeps the calls in order
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.create_task(self._write())
+
+    def send_message(self, chat_id: int, text: str):
+        self.enqueue(chat_id, 'send_message', text=text)
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str):
+        self.enqueue(chat_id, 'edit_message_text', message_id=message_id, text=text)
+
+    def send_document(self, chat_id: int, document: bytes, filename: str, caption: Optional[str] = None):
+        self.enqueue(chat_id, 'send_document', document=document, filename=filename, caption=caption)
+
+    def _store(self, batch: List[Dict[str, Any]]):
+        for message in batch:
+            kwargs = message['kwargs']
+            if 'document' in kwargs:
+                kwargs['document_blob'] = self.blobs.put(bytes(kwargs.pop('document')))
+        self.messages.put_many(batch)
+
+    async def _write(self):
+        while self.buffer:
+            batch = list(self.buffer)
+            self.buffer.clear()
+            try:
+                await asyncio.to_thread(self._store, batch)
+            except Exception as e:
+                logger.error(f"Error queueing {len(batch)} outbound messages: {e}")
+
+    async def flush(self):
+        """Wait until every queued call is in the shared message queue"""
+        while self.writer is not None and not self.writer.done():
+            await self.writer
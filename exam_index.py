@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Exam Index Export
+تصدير فهرس جاهز لتطبيق الاختبارات (أنواع الأسئلة، الاختبارات، القطع، أرقام الإجابات)
+
+Layout written to the output directory:
+    manifest.json            every file with its sha256 and size, for incremental updates
+    index.json               per-type and per-exam question ID arrays (these carry the order),
+                             the shards of each type and the shards holding each exam
+    passages.json            reading passages with their shard and the IDs of the questions they cover
+    questions/<type>-NNN.json  question shards, answers as choice indices
+
+Question and passage IDs are hashes of their content. A question's shard is
+picked from its passage ID, or from its own ID when it has no passage, so a
+passage's questions share one shard and adding or removing a question only
+rewrites its own shard plus index.json and passages.json. To show one exam a
+client loads index.json["exam_shards"][exam] and orders the records by
+index.json["exams"][exam]; one passage needs only its "shard".
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from typing import List, Dict, Any, Optional
+from formats import load_questions
+from normalize import normalize_many, LIGHT, SEPARATOR
+
+# Category names used by the extractor -> question types used by the exam app
+CATEGORY_TYPES = {
+    "التناظر اللفظي": "analogy",
+    "إكمال الجمل": "completion",
+    "الخطأ السياقي": "error",
+    "استيعاب المقروء": "rc",
+    "المفردة الشاذة": "odd",
+}
+TYPE_ORDER = ["analogy", "completion", "error", "rc", "odd", "other"]
+
+SHARD_SIZE = 500
+MANIFEST_VERSION = 2
+ID_LENGTH = 12  # hex digits of the content hash kept in IDs
+
+
+def question_type(question: Dict[str, Any]) -> str:
+    return CATEGORY_TYPES.get(str(question.get("category", "")).strip(), "other")
+
+
+def answer_index(question: Dict[str, Any]) -> Optional[int]:
+    """Index of the correct choice, or None when the answer matches no choice"""
+    choices = question.get("choices") or []
+    # Set at extraction time by normalize.annotate_answers
+    index = question.get("answer_index")
+    if isinstance(index, int) and 0 <= index < len(choices):
+        return index
+    answer = question.get("answer")
+    if isinstance(answer, int) and 0 <= answer < len(choices):
+        return answer
+    if isinstance(answer, str) and answer in choices:
+        return choices.index(answer)
+    return None
+
+
+def content_hash(*texts: str) -> str:
+    return hashlib.sha256(SEPARATOR.join(normalize_many(list(texts), LIGHT)).encode("utf-8")).hexdigest()[:ID_LENGTH]
+
+
+def question_id(qtype: str, question: Dict[str, Any]) -> str:
+    """ID derived from type, question, choices and passage, so it survives reordering"""
+    choices = [str(choice) for choice in question.get("choices") or []]
+    return f"{qtype}:{content_hash(qtype, str(question['question']), str(question.get('passage', '')), *choices)}"
+
+
+def shard_count(items: int, shard_size: int) -> int:
+    """Power of two giving about shard_size questions per shard; only changes when the type doubles or halves"""
+    count = 1
+    while count * shard_size < items:
+        count *= 2
+    return count
+
+
+def shard_path(qtype: str, shard_number: int) -> str:
+    return f"questions/{qtype}-{shard_number:03d}.json"
+
+
+def encode(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def group_by_passage(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reorder RC questions so each passage's questions are contiguous (first appearance order)"""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for question in questions:
+        groups.setdefault(str(question.get("passage", "")).strip(), []).append(question)
+    return [question for group in groups.values() for question in group]
+
+
+def build_index(questions: List[Dict[str, Any]], shard_size: int = SHARD_SIZE) -> Dict[str, bytes]:
+    """Build every index file; returns relative path -> file content"""
+    by_type: Dict[str, List[Dict[str, Any]]] = {}
+    for question in questions:
+        if isinstance(question, dict) and question.get("question"):
+            by_type.setdefault(question_type(question), []).append(question)
+
+    files: Dict[str, bytes] = {}
+    type_ids: Dict[str, List[str]] = {}
+    exam_ids: Dict[str, List[str]] = {}
+    passages: Dict[str, Dict[str, Any]] = {}  # passage text -> passage entry
+    type_shards: Dict[str, List[str]] = {}
+    exam_shards: Dict[str, set] = {}
+
+    for qtype in TYPE_ORDER:
+        items = by_type.get(qtype)
+        if not items:
+            continue
+        if qtype == "rc":
+            items = group_by_passage(items)
+
+        count = shard_count(len(items), shard_size)
+        shards: List[List[Dict[str, Any]]] = [[] for _ in range(count)]
+        seen: Dict[str, int] = {}
+        for question in items:
+            base_id = question_id(qtype, question)
+            # Repeated identical questions are numbered in order of appearance
+            seen[base_id] = seen.get(base_id, 0) + 1
+            record_id = base_id if seen[base_id] == 1 else f"{base_id}-{seen[base_id]}"
+            record = {
+                "id": record_id,
+                "type": qtype,
+                "question": question["question"],
+                "choices": question.get("choices") or [],
+                "answer": answer_index(question),
+                "exam": question.get("exam", ""),
+                "source_number": question.get("question_number"),
+            }
+
+            passage = None
+            passage_text = str(question.get("passage", "")).strip()
+            if passage_text:
+                passage = passages.get(passage_text)
+                if passage is None:
+                    passage = passages[passage_text] = {
+                        "id": f"p:{content_hash(passage_text)}", "text": passage_text, "type": qtype, "questions": []
+                    }
+                passage["questions"].append(record_id)
+                record["passage"] = passage["id"]
+
+            # A passage's questions share its shard, so one shard shows the whole passage
+            shard_key = passage["id"] if passage else base_id
+            shard_number = int(shard_key.rsplit(":", 1)[1], 16) % count
+            shards[shard_number].append(record)
+            path = shard_path(qtype, shard_number)
+            if passage:
+                passage["shard"] = path
+            type_ids.setdefault(qtype, []).append(record_id)
+            exam_ids.setdefault(record["exam"], []).append(record_id)
+            exam_shards.setdefault(record["exam"], set()).add(path)
+
+        type_shards[qtype] = []
+        for shard_number, records in enumerate(shards):
+            if not records:
+                continue
+            path = shard_path(qtype, shard_number)
+            files[path] = encode(records)
+            type_shards[qtype].append(path)
+
+    files["index.json"] = encode({
+        "types": type_ids,
+        "exams": exam_ids,
+        "shards": type_shards,
+        "exam_shards": {exam: sorted(paths) for exam, paths in exam_shards.items()},
+        "shard_size": shard_size,
+    })
+    files["passages.json"] = encode(list(passages.values()))
+    return files
+
+
+def build_manifest(files: Dict[str, bytes], questions_count: int) -> Dict[str, Any]:
+    entries = {}
+    for path in sorted(files):
+        data = files[path]
+        entries[path] = {"sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data)}
+    content_hash = hashlib.sha256("".join(entry["sha256"] for entry in entries.values()).encode()).hexdigest()
+    return {
+        "version": MANIFEST_VERSION,
+        "content_hash": content_hash,
+        "questions": questions_count,
+        "files": entries,
+    }
+
+
+def export_index(questions: List[Dict[str, Any]], output_dir: str, shard_size: int = SHARD_SIZE) -> Dict[str, Any]:
+    """Write the index to output_dir, leaving unchanged files untouched and removing stale shards"""
+    files = build_index(questions, shard_size)
+    count = sum(1 for question in questions if isinstance(question, dict) and question.get("question"))
+    manifest = build_manifest(files, count)
+
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    previous_files = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                previous_files = json.load(f).get("files", {})
+        except Exception as e:
+            print(f"Warning: Could not read previous manifest: {e}")
+
+    written = 0
+    for path, data in files.items():
+        full_path = os.path.join(output_dir, path)
+        if previous_files.get(path, {}).get("sha256") == manifest["files"][path]["sha256"] and os.path.exists(full_path):
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(data)
+        written += 1
+
+    for path in previous_files:
+        if path not in files and os.path.exists(os.path.join(output_dir, path)):
+            os.remove(os.path.join(output_dir, path))
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"Exported {count} questions in {len(files)} files ({written} changed) to {output_dir}")
+    return manifest
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="تصدير فهرس جاهز لتطبيق الاختبارات من ملفات الأسئلة")
+    arg_parser.add_argument("inputs", nargs="+", help="ملفات الأسئلة (json, jsonl, gz, zst, msgpack)")
+    arg_parser.add_argument("--output", default="exam_index", help="مجلد الإخراج")
+    arg_parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="عدد الأسئلة في كل جزء")
+    args = arg_parser.parse_args()
+
+    try:
+        questions = []
+        for path in args.inputs:
+            questions.extend(load_questions(path))
+        export_index(questions, args.output, args.shard_size)
+    except Exception as e:
+        print(f"خطأ: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Fake Telegram Bot API
+خادم محلي يحاكي واجهة Bot API لاختبار الحمل دون الاتصال بتليجرام
+
+Implements the methods the bot uses (getMe, deleteWebhook, getUpdates, getFile,
+file download, sendMessage, editMessageText, sendDocument, answerCallbackQuery).
+Point the bot at it with BOT_API_BASE_URL=http://host:port. Tests push updates
+(uploads and button taps) and wait for the bot's replies per chat.
+"""
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable
+from aiohttp import web
+from delivery import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+CHAT_METHODS = ("sendMessage", "editMessageText", "sendDocument")
+
+
+class ChatLog:
+    """Bot API calls received for one chat"""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.changed = asyncio.Event()
+        self.next_message_id = 1
+
+    def add(self, event: Dict[str, Any]):
+        self.events.append(event)
+        self.changed.set()
+
+
+class FakeBotAPI:
+    """aiohttp application answering Bot API requests from in-memory state
+
+    flood_chat_rate / flood_global_rate enable Telegram-style flood control:
+    chat methods over the limit get a 429 with retry_after.
+    """
+
+    def __init__(self, flood_chat_rate: Optional[float] = None, flood_chat_burst: float = 3,
+                 flood_global_rate: Optional[float] = None):
+        self.updates: List[Dict[str, Any]] = []
+        self.next_update_id = 1
+        self.update_available = asyncio.Event()
+        self.polled = asyncio.Event()
+        self.files: Dict[str, bytes] = {}
+        self.chats: Dict[int, ChatLog] = {}
+        self.calls: Dict[str, int] = {}
+        self.flood_errors = 0
+
+        self.flood_chat_rate = flood_chat_rate
+        self.flood_chat_burst = flood_chat_burst
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.global_bucket = TokenBucket(flood_global_rate, flood_global_rate) if flood_global_rate else None
+
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        self.app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        self.runner = None
+        self.url = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Serve on host:port (0 picks a free port) and return the base URL"""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_host, bound_port = self.runner.addresses[0][:2]
+        self.url = f"http://{bound_host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def chat(self, chat_id: int) -> ChatLog:
+        log = self.chats.get(chat_id)
+        if log is None:
+            log = self.chats[chat_id] = ChatLog()
+        return log
+
+    # ------------------------------------------------------------------
+    # Updates pushed by the driver
+    # ------------------------------------------------------------------
+
+    def _user(self, chat_id: int) -> Dict[str, Any]:
+        return {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+
+    def _chat(self, chat_id: int) -> Dict[str, Any]:
+        return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+
+    def _push(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        update["update_id"] = self.next_update_id
+        self.next_update_id += 1
+        self.updates.append(update)
+        self.update_available.set()
+        return update
+
+    def push_document(self, chat_id: int, data: bytes, file_name: str) -> Dict[str, Any]:
+        """Simulate a user sending a file"""
+        file_id = uuid.uuid4().hex
+        self.files[file_id] = bytes(data)
+        log = self.chat(chat_id)
+        message_id = log.next_message_id
+        log.next_message_id += 1
+        return self._push({"message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": self._user(chat_id),
+            "document": {"file_id": file_id, "file_unique_id": file_id, "file_name": file_name,
+                         "file_size": len(data)},
+        }})
+
+    def push_callback(self, chat_id: int, message_id: int, data: str) -> Dict[str, Any]:
+        """Simulate a user tapping an inline button on one of the bot's messages"""
+        return self._push({"callback_query": {
+            "id": uuid.uuid4().hex,
+            "from": self._user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()), "chat": self._chat(chat_id),
+                        "from": BOT_USER, "text": "..."},
+        }})
+
+    async def wait_for(self, chat_id: int, predicate: Callable[[Dict[str, Any]], bool],
+                       count: int = 1, timeout: float = 60) -> Dict[str, Any]:
+        """Wait until the bot made `count` calls matching predicate for the chat; returns the last one"""
+        log = self.chat(chat_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            matches = [event for event in log.events if predicate(event)]
+            if len(matches) >= count:
+                return matches[count - 1]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"chat {chat_id}: timed out waiting for the bot")
+            log.changed.clear()
+            try:
+                await asyncio.wait_for(log.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Bot API
+    # ------------------------------------------------------------------
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(request.query)
+        if request.method == 'POST':
+            if request.content_type == 'application/json':
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            return self._error(404, "Not Found: method not found")
+
+        if method in CHAT_METHODS:
+            retry_after = self._flood_check(int(params['chat_id']))
+            if retry_after:
+                self.flood_errors += 1
+                return self._error(429, f"Too Many Requests: retry after {retry_after}",
+                                   {"retry_after": retry_after})
+
+        try:
+            result = await handler(params)
+        except (KeyError, ValueError) as e:
+            return self._error(400, f"Bad Request: {e}")
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info['path'].rsplit('/', 1)[-1]
+        data = self.files.get(file_id)
+        if data is None:
+            return web.Response(status=404)
+        return web.Response(body=data)
+
+    def _error(self, code: int, description: str, parameters: Optional[Dict[str, Any]] = None) -> web.Response:
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    def _flood_check(self, chat_id: int) -> int:
+        """Seconds the caller must wait, or 0 when the call is within the limits"""
+        buckets = []
+        if self.flood_chat_rate:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.flood_chat_rate, self.flood_chat_burst)
+            buckets.append(bucket)
+        if self.global_bucket is not None:
+            buckets.append(self.global_bucket)
+
+        wait = max((bucket.delay() for bucket in buckets), default=0)
+        if wait > 0:
+            return max(1, int(wait + 0.999))
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return 0
+
+    def _message(self, chat_id: int, message_id: Optional[int] = None, **fields) -> Dict[str, Any]:
+        if message_id is None:
+            log = self.chat(chat_id)
+            message_id = log.next_message_id
+            log.next_message_id += 1
+        message = {"message_id": message_id, "date": int(time.time()), "chat": self._chat(chat_id), "from": BOT_USER}
+        message.update({key: value for key, value in fields.items() if value is not None})
+        return message
+
+    def _record(self, method: str, chat_id: int, message: Dict[str, Any], **extra):
+        event = {"method": method, "time": time.monotonic(), "message_id": message["message_id"],
+                 "text": message.get("text") or message.get("caption") or "", **extra}
+        self.chat(chat_id).add(event)
+
+    @staticmethod
+    def _markup(params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        markup = params.get('reply_markup')
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        return markup
+
+    async def api_getMe(self, params):
+        return BOT_USER
+
+    async def api_deleteWebhook(self, params):
+        return True
+
+    async def api_getUpdates(self, params):
+        self.polled.set()
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # Updates below the offset were confirmed by the client
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self.update_available.clear()
+            try:
+                await asyncio.wait_for(self.update_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    async def api_getFile(self, params):
+        file_id = params['file_id']
+        if file_id not in self.files:
+            raise ValueError("file not found")
+        return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.files[file_id]),
+                "file_path": f"documents/{file_id}"}
+
+    async def api_answerCallbackQuery(self, params):
+        return True
+
+    async def api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        markup = self._markup(params)
+        message = self._message(chat_id, text=params['text'], reply_markup=markup)
+        self._record("sendMessage", chat_id, message, reply_markup=markup)
+        return message
+
+    async def api_editMessageText(self, params):
+        chat_id = int(params['chat_id'])
+        markup = self._markup(params)
+        message = self._message(chat_id, int(params['message_id']), text=params['text'], reply_markup=markup)
+        self._record("editMessageText", chat_id, message, reply_markup=markup)
+        return message
+
+    async def api_sendDocument(self, params):
+        chat_id = int(params['chat_id'])
+        field = params['document']
+        data = field.file.read() if hasattr(field, 'file') else str(field).encode('utf-8')
+        file_name = getattr(field, 'filename', None) or "document"
+        file_id = uuid.uuid4().hex
+        message = self._message(
+            chat_id, caption=params.get('caption'),
+            document={"file_id": file_id, "file_unique_id": file_id, "file_name": file_name, "file_size": len(data)}
+        )
+        self._record("sendDocument", chat_id, message, file_name=file_name, size=len(data))
+        return message
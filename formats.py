@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Question File Formats
+قراءة وكتابة ملفات الأسئلة بصيغ متعددة (JSON, JSONL, gzip, zstd, MessagePack)
+"""
+
+import io
+import gzip
+import json
+from typing import List, Dict, Any, Iterator, BinaryIO
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+# Output formats: name -> file extension, encoding, compression and label shown to users
+FORMATS = {
+    "json": {"extension": ".json", "encoding": "json", "compression": None, "label": "JSON منسق"},
+    "compact": {"extension": ".json", "encoding": "compact", "compression": None, "label": "JSON مضغوط المسافات"},
+    "jsonl": {"extension": ".jsonl", "encoding": "jsonl", "compression": None, "label": "JSON Lines"},
+    "json.gz": {"extension": ".json.gz", "encoding": "compact", "compression": "gzip", "label": "JSON + gzip"},
+    "jsonl.gz": {"extension": ".jsonl.gz", "encoding": "jsonl", "compression": "gzip", "label": "JSON Lines + gzip"},
+    "json.zst": {"extension": ".json.zst", "encoding": "compact", "compression": "zstd", "label": "JSON + zstd"},
+    "jsonl.zst": {"extension": ".jsonl.zst", "encoding": "jsonl", "compression": "zstd", "label": "JSON Lines + zstd"},
+    "msgpack": {"extension": ".msgpack", "encoding": "msgpack", "compression": None, "label": "MessagePack"},
+}
+DEFAULT_FORMAT = "json"
+
+INPUT_EXTENSIONS = (".json", ".jsonl", ".gz", ".zst", ".msgpack", ".mpk")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# First byte of a MessagePack array or map (fixarray, fixmap, array 16/32, map 16/32)
+MSGPACK_CONTAINERS = frozenset(range(0x80, 0xa0)) | {0xdc, 0xdd, 0xde, 0xdf}
+CHUNK_SIZE = 64 * 1024
+
+
+def available_formats() -> List[str]:
+    """Formats whose optional dependencies are installed"""
+    names = []
+    for name, spec in FORMATS.items():
+        if spec["compression"] == "zstd" and zstandard is None:
+            continue
+        if spec["encoding"] == "msgpack" and msgpack is None:
+            continue
+        names.append(name)
+    return names
+
+
+def with_format_extension(file_name: str, fmt: str) -> str:
+    """Replace the extension of an input file name with the one of the output format"""
+    base = file_name
+    lowered = base.lower()
+    for extension in (".html", ".htm") + INPUT_EXTENSIONS:
+        if lowered.endswith(extension):
+            base = base[:-len(extension)]
+            lowered = base.lower()
+    # Strip an inner .json/.jsonl left over from names such as "bank.json.gz"
+    for extension in (".json", ".jsonl"):
+        if lowered.endswith(extension):
+            base = base[:-len(extension)]
+            break
+    return base + FORMATS[fmt]["extension"]
+
+
+def is_supported_input(file_name: str) -> bool:
+    """Check whether a file name looks like a question file we can load"""
+    return file_name.lower().endswith(INPUT_EXTENSIONS)
+
+
+def iter_encoded(questions: List[Dict[str, Any]], encoding: str) -> Iterator[bytes]:
+    """Encode questions chunk by chunk without building the whole document in memory"""
+    if encoding == "jsonl":
+        for question in questions:
+            yield (json.dumps(question, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        return
+
+    if encoding == "json":
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+    else:
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    buffer = []
+    size = 0
+    for chunk in encoder.iterencode(questions):
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def write_questions(questions: List[Dict[str, Any]], stream: BinaryIO, fmt: str = DEFAULT_FORMAT):
+    """Write questions to a binary stream in the given format"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    spec = FORMATS[fmt]
+
+    if spec["encoding"] == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("MessagePack output requires the 'msgpack' package")
+        packer = msgpack.Packer()
+        stream.write(packer.pack_array_header(len(questions)))
+        for question in questions:
+            stream.write(packer.pack(question))
+        return
+
+    if spec["compression"] == "gzip":
+        with gzip.GzipFile(fileobj=stream, mode="wb", compresslevel=6, mtime=0) as compressed:
+            for chunk in iter_encoded(questions, spec["encoding"]):
+                compressed.write(chunk)
+    elif spec["compression"] == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd output requires the 'zstandard' package")
+        compressor = zstandard.ZstdCompressor(level=10)
+        with compressor.stream_writer(stream, closefd=False) as compressed:
+            for chunk in iter_encoded(questions, spec["encoding"]):
+                compressed.write(chunk)
+    else:
+        for chunk in iter_encoded(questions, spec["encoding"]):
+            stream.write(chunk)
+
+
+def dump_questions(questions: List[Dict[str, Any]], fmt: str = DEFAULT_FORMAT) -> bytes:
+    """Serialize questions to bytes in the given format"""
+    buffer = io.BytesIO()
+    write_questions(questions, buffer, fmt)
+    return buffer.getvalue()
+
+
+def save_questions(questions: List[Dict[str, Any]], file_path: str, fmt: str = DEFAULT_FORMAT):
+    """Serialize questions to a file in the given format"""
+    with open(file_path, "wb") as f:
+        write_questions(questions, f, fmt)
+
+
+def _open_decompressed(raw: BinaryIO) -> BinaryIO:
+    """Wrap a raw stream with the matching decompressor based on its magic bytes"""
+    buffered = io.BufferedReader(raw) if not hasattr(raw, "peek") else raw
+    head = buffered.peek(4)[:4]
+    if head.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=buffered, mode="rb")
+    if head == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Reading zstd files requires the 'zstandard' package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(buffered))
+    return buffered
+
+
+def read_questions(raw: BinaryIO) -> List[Any]:
+    """Read questions from a binary stream in any supported format"""
+    stream = _open_decompressed(raw)
+    head = stream.peek(64).lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+
+    if head and head[0] in MSGPACK_CONTAINERS:
+        if msgpack is None:
+            raise RuntimeError("Reading MessagePack files requires the 'msgpack' package")
+        data = msgpack.unpack(stream, raw=False)
+        return data if isinstance(data, list) else [data]
+    if head and head not in (b"[", b"{"):
+        raise ValueError("Expected a JSON array, JSON objects or MessagePack")
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    try:
+        if head == b"[":
+            data = json.load(text)
+        else:
+            first_line = text.readline()
+            try:
+                first = json.loads(first_line)
+            except json.JSONDecodeError:
+                # A single pretty-printed object rather than JSON Lines (or nothing at all)
+                first = None
+                content = first_line + text.read()
+                data = json.loads(content) if content.strip() else []
+            if first is not None:
+                data = [first] + [json.loads(line) for line in text if line.strip()]
+    finally:
+        text.detach()
+
+    if not isinstance(data, list):
+        data = [data] if data else []
+    return data
+
+
+def load_questions(file_path: str) -> List[Any]:
+    """Load questions from a file in any supported format"""
+    with open(file_path, "rb") as f:
+        return read_questions(f)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Load Test
+اختبار الحمل: مستخدمون افتراضيون يرسلون ملفات HTML ويضغطون أزرار الأقسام والدمج
+
+Runs the bot in this process against fake_bot_api.FakeBotAPI (or, with
+--external, waits for a bot started with BOT_API_BASE_URL pointing at it) and
+reports end-to-end latency percentiles, throughput, event-loop lag and memory
+over time. Lag and memory are measured in this process, so with --external
+they are left out; pass --health-url to read the external bot's lag from its
+/health endpoint instead.
+
+    python loadtest.py --users 200 --ramp 20 --merge-ratio 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import List, Dict, Any, Optional
+from aiohttp import ClientSession, ClientTimeout
+from fake_bot_api import FakeBotAPI
+from parse_html import HTMLResultsParser
+from formats import dump_questions
+from loop_monitor import LoopLagMonitor, monitor, percentile
+
+LOADTEST_TOKEN = "123456:LOADTEST"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sample pages shipped with the repo and the category button to tap for each
+SAMPLES = [
+    {"html": "التناظر 3.html", "category_key": "1", "category": "التناظر اللفظي"},
+    {"html": "استيعاب المقروء.html", "category_key": "3", "category": "استيعاب المقروء"},
+]
+
+
+def rss_mb() -> float:
+    """Resident memory of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def has_button(event: Dict[str, Any], prefix: str) -> bool:
+    markup = event.get("reply_markup") or {}
+    return any(str(button.get("callback_data", "")).startswith(prefix)
+               for row in markup.get("inline_keyboard", []) for button in row)
+
+
+class LoadTest:
+    """Simulated users driving the bot through the fake Bot API"""
+
+    def __init__(self, api: FakeBotAPI, users: int, ramp: float, merge_ratio: float,
+                 timeout: float = 120, seed: int = 0, external: bool = False, health_url: Optional[str] = None):
+        self.api = api
+        self.external = external  # the bot runs in another process: local lag and RSS say nothing about it
+        self.health_url = health_url
+        self.health_first: Optional[Dict[str, Any]] = None  # external bot's /health before and after the run
+        self.health: Optional[Dict[str, Any]] = None
+        self.users = users
+        self.ramp = ramp
+        self.merge_ratio = merge_ratio
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+
+        self.pages = []
+        self.merge_files = []
+        for sample in SAMPLES:
+            with open(os.path.join(BASE_DIR, sample["html"]), "rb") as f:
+                self.pages.append((sample, f.read()))
+            questions = HTMLResultsParser().parse_html_content(self.pages[-1][1].decode("utf-8"), sample["category"])
+            self.merge_files.append((sample["html"].replace(".html", ".json"), dump_questions(questions, "json")))
+
+        self.latencies: Dict[str, List[float]] = {"extract": [], "merge": []}
+        self.first_reply: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.started = 0
+        self.completed = 0
+        # Own probe with a window covering the whole run; the shared monitor's watchdog names blocking handlers
+        self.lag = LoopLagMonitor(interval=0.05, window=24 * 3600, watchdog_threshold=0)
+        self.timeline: List[Dict[str, Any]] = []
+
+    async def extract_flow(self, chat_id: int):
+        sample, data = self.rng.choice(self.pages)
+        start = time.monotonic()
+        self.api.push_document(chat_id, data, sample["html"])
+        menu = await self.api.wait_for(chat_id, lambda e: has_button(e, "cat_"), timeout=self.timeout)
+        self.first_reply.append(menu["time"] - start)
+
+        self.api.push_callback(chat_id, menu["message_id"], f"cat_{sample['category_key']}")
+        await self.api.wait_for(chat_id, lambda e: e["method"] == "sendDocument", timeout=self.timeout)
+        self.latencies["extract"].append(time.monotonic() - start)
+
+    async def merge_flow(self, chat_id: int):
+        start = time.monotonic()
+        # The tap comes from a main menu message the bot sent earlier
+        self.api.push_callback(chat_id, 1, "merge_files")
+        prompt = await self.api.wait_for(chat_id, lambda e: has_button(e, "execute_merge"), timeout=self.timeout)
+        self.first_reply.append(prompt["time"] - start)
+
+        for file_name, data in self.merge_files:
+            self.api.push_document(chat_id, data, file_name)
+        await self.api.wait_for(chat_id, lambda e: e["method"] == "sendMessage" and "تم إضافة الملف" in e["text"],
+                                count=len(self.merge_files), timeout=self.timeout)
+
+        self.api.push_callback(chat_id, prompt["message_id"], "execute_merge")
+        await self.api.wait_for(chat_id, lambda e: e["method"] == "sendDocument", timeout=self.timeout)
+        self.latencies["merge"].append(time.monotonic() - start)
+
+    async def user(self, chat_id: int, delay: float):
+        await asyncio.sleep(delay)
+        self.started += 1
+        flow = self.merge_flow if self.rng.random() < self.merge_ratio else self.extract_flow
+        try:
+            await flow(chat_id)
+        except asyncio.TimeoutError:
+            self.errors["timeout"] = self.errors.get("timeout", 0) + 1
+        except Exception as e:
+            name = type(e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+        finally:
+            self.completed += 1
+
+    async def fetch_health(self, session: ClientSession) -> Optional[Dict[str, Any]]:
+        """The external bot's /health JSON (served with 503 when degraded), or None when unreachable"""
+        try:
+            async with session.get(self.health_url, timeout=ClientTimeout(total=2)) as response:
+                return await response.json()
+        except Exception:
+            return None
+
+    async def sample_timeline(self, start: float, interval: float = 1.0):
+        session = ClientSession() if self.health_url else None
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                lag_p99, rss = None, None
+                if session is not None:
+                    health = await self.fetch_health(session)
+                    if health is not None:
+                        lag_p99 = health["lag_ms"]["p99"]
+                elif not self.external:
+                    lag_p99 = self.lag.lag_percentiles(seconds=interval)["p99"]
+                    rss = round(rss_mb(), 1)
+                self.timeline.append({
+                    "t": round(time.monotonic() - start, 1),
+                    "in_flight": self.started - self.completed,
+                    "completed": self.completed,
+                    "lag_p99_ms": lag_p99,
+                    "rss_mb": rss,
+                    "flood_429": self.api.flood_errors,
+                })
+        finally:
+            if session is not None:
+                await session.close()
+
+    async def run(self) -> Dict[str, Any]:
+        if self.health_url:
+            async with ClientSession() as session:
+                self.health_first = await self.fetch_health(session)
+        start = time.monotonic()
+        self.lag.start()
+        stalls_before = monitor.stalls
+        samplers = [asyncio.create_task(self.sample_timeline(start))]
+        try:
+            await asyncio.gather(*(
+                self.user(10_000 + i, self.ramp * i / max(1, self.users)) for i in range(self.users)
+            ))
+        finally:
+            for task in samplers:
+                task.cancel()
+            await asyncio.gather(*samplers, return_exceptions=True)
+            await self.lag.stop()
+        if self.health_url:
+            async with ClientSession() as session:
+                self.health = await self.fetch_health(session)
+        return self.report(time.monotonic() - start, monitor.stalls - stalls_before)
+
+    def report(self, elapsed: float, stalls: int = 0) -> Dict[str, Any]:
+        def summary(values: List[float]) -> Dict[str, float]:
+            return {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+                "max": round(max(values), 3) if values else 0.0,
+            }
+
+        done = sum(len(values) for values in self.latencies.values())
+        if not self.external:
+            lag_source, lag = "in process", self.lag.lag_percentiles()
+            peak_rss = max((row["rss_mb"] for row in self.timeline), default=round(rss_mb(), 1))
+        elif self.health is not None:
+            # The bot's own percentiles over its LOOP_LAG_WINDOW; its memory is not exposed
+            lag_source, lag, peak_rss = "bot /health", self.health["lag_ms"], None
+            stalls = self.health["stalls"] - (self.health_first or self.health)["stalls"]
+        else:
+            lag_source, lag, peak_rss, stalls = None, None, None, None
+        return {
+            "users": self.users,
+            "elapsed": round(elapsed, 2),
+            "throughput": round(done / elapsed, 2) if elapsed else 0.0,
+            "latency": {name: summary(values) for name, values in self.latencies.items()},
+            "first_reply": summary(self.first_reply),
+            "loop_lag_source": lag_source,
+            "loop_lag_ms": lag,
+            "loop_stalls": stalls,
+            "peak_rss_mb": peak_rss,
+            "api_calls": dict(sorted(self.api.calls.items())),
+            "flood_429": self.api.flood_errors,
+            "errors": self.errors,
+            "timeline": self.timeline,
+        }
+
+
+def print_report(report: Dict[str, Any], stream=None):
+    stream = stream or sys.stdout
+    out = lambda line="": print(line, file=stream)
+
+    out(f"Users: {report['users']}   elapsed: {report['elapsed']}s   throughput: {report['throughput']} flows/s")
+    out()
+    out(f"{'latency (s)':<14}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = dict(report["latency"], first_reply=report["first_reply"])
+    for name, row in rows.items():
+        out(f"{name:<14}{row['count']:>7}{row['p50']:>9}{row['p95']:>9}{row['p99']:>9}{row['max']:>9}")
+    lag = report["loop_lag_ms"]
+    out()
+    if lag is None:
+        out("Event-loop lag: not measured (external bot; pass --health-url to read its /health)")
+    else:
+        out(f"Event-loop lag (ms, {report['loop_lag_source']}): p50 {lag['p50']}  p95 {lag['p95']}  p99 {lag['p99']}"
+            f"  max {lag['max']}   stalls logged by the watchdog: {report['loop_stalls']}")
+    peak_rss = "n/a (external bot)" if report["peak_rss_mb"] is None else f"{report['peak_rss_mb']} MB"
+    out(f"Peak RSS: {peak_rss}   429 responses: {report['flood_429']}   errors: {report['errors'] or 'none'}")
+    out(f"API calls: {report['api_calls']}")
+    out()
+    out(f"{'t (s)':>7}{'in flight':>11}{'done':>7}{'lag p99 ms':>12}{'RSS MB':>9}{'429':>6}")
+    for row in report["timeline"]:
+        lag_p99, rss = ("-" if value is None else value for value in (row["lag_p99_ms"], row["rss_mb"]))
+        out(f"{row['t']:>7}{row['in_flight']:>11}{row['completed']:>7}{lag_p99:>12}{rss:>9}{row['flood_429']:>6}")
+
+
+async def run_load_test(users: int, ramp: float = 0, merge_ratio: float = 0.2, workers: int = 1,
+                        flood: bool = False, external: bool = False, port: int = 0,
+                        timeout: float = 120, seed: int = 0, health_url: Optional[str] = None) -> Dict[str, Any]:
+    """Start the fake Bot API (and the bot unless external) and drive the users"""
+    api = FakeBotAPI(flood_chat_rate=1 if flood else None, flood_global_rate=30 if flood else None)
+    url = await api.start(port=port)
+
+    application = None
+    bot = None
+    worker_tasks = []
+    monitor.start()
+    try:
+        if external:
+            print(f"Fake Bot API on {url}; start the bot with BOT_API_BASE_URL={url} BOT_TOKEN={LOADTEST_TOKEN}",
+                  file=sys.stderr)
+            await api.polled.wait()
+        else:
+            from bot import QuestionExtractionBot, build_application
+            from backends import create_stores
+            from worker import ParseWorker
+
+            sessions, jobs, blobs = create_stores()
+            bot = QuestionExtractionBot(sessions, jobs, blobs)
+            application = build_application(bot, token=LOADTEST_TOKEN, base_url=url)
+            await application.initialize()
+            bot.outbox.start(application.bot)
+            await application.start()
+            await application.updater.start_polling(timeout=5)
+            worker_tasks = [asyncio.create_task(ParseWorker(jobs, sessions, blobs, bot.outbox).run())
+                            for _ in range(workers)]
+
+        test = LoadTest(api, users, ramp, merge_ratio, timeout=timeout, seed=seed,
+                        external=external, health_url=health_url if external else None)
+        return await test.run()
+    finally:
+        for task in worker_tasks:
+            task.cancel()
+        await asyncio.gather(*worker_tasks, return_exceptions=True)
+        if application is not None:
+            if application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            await bot.outbox.stop()
+            await application.shutdown()
+        await api.stop()
+        await monitor.stop()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="اختبار حمل البوت باستخدام خادم Bot API محلي")
+    arg_parser.add_argument("--users", type=int, default=100, help="عدد المستخدمين الافتراضيين")
+    arg_parser.add_argument("--ramp", type=float, default=10, help="ثوانٍ لبدء كل المستخدمين تدريجياً")
+    arg_parser.add_argument("--merge-ratio", type=float, default=0.2, help="نسبة المستخدمين الذين يدمجون ملفات")
+    arg_parser.add_argument("--workers", type=int, default=1, help="عدد عمال المعالجة داخل العملية")
+    arg_parser.add_argument("--flood", action="store_true", help="محاكاة حدود الإرسال في تليجرام (429)")
+    arg_parser.add_argument("--external", action="store_true", help="عدم تشغيل البوت داخلياً وانتظار بوت خارجي")
+    arg_parser.add_argument("--health-url", help="رابط /health للبوت الخارجي لقراءة تأخر حلقة أحداثه")
+    arg_parser.add_argument("--port", type=int, default=0, help="منفذ خادم Bot API المحلي (0 = أي منفذ متاح)")
+    arg_parser.add_argument("--timeout", type=float, default=120, help="أقصى انتظار لكل خطوة بالثواني")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--json", help="حفظ التقرير في ملف JSON")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    for name in ("httpx", "telegram", "bot", "worker", "delivery"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    # The parser prints every question; keep the report readable
+    report_stream = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            report = asyncio.run(run_load_test(
+                args.users, args.ramp, args.merge_ratio, args.workers, args.flood,
+                args.external, args.port, args.timeout, args.seed, args.health_url
+            ))
+        finally:
+            sys.stdout = report_stream
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Event Loop Health Monitor
+مراقبة تأخر حلقة الأحداث وتسجيل الكود الذي يعطلها
+
+A probe task sleeps for a fixed interval and records how late it wakes up
+(loop lag). A watchdog thread notices when the probe stops ticking and logs
+the loop thread's current stack together with the watched handlers that are
+running, so a blocking call shows up with its exact code path.
+"""
+
+import os
+import sys
+import math
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import itertools
+import traceback
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 0.1))  # seconds between probes
+LAG_WINDOW = float(os.getenv('LOOP_LAG_WINDOW', 60))  # seconds of samples kept for percentiles
+DEGRADED_LAG_MS = float(os.getenv('LOOP_LAG_DEGRADED_MS', 500))  # p99 lag that makes /health degraded
+WATCHDOG_THRESHOLD = float(os.getenv('WATCHDOG_THRESHOLD', 1.0))  # seconds blocked before logging a stack, 0 = off
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile; 0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LoopLagMonitor:
+    """Measure event-loop lag and report handlers that block the loop"""
+
+    def __init__(self, interval: float = LAG_INTERVAL, window: float = LAG_WINDOW,
+                 degraded_ms: float = DEGRADED_LAG_MS, watchdog_threshold: float = WATCHDOG_THRESHOLD):
+        self.interval = interval
+        self.degraded_ms = degraded_ms
+        self.watchdog_threshold = watchdog_threshold
+        self.samples: deque = deque(maxlen=max(1, int(window / interval)))  # (time, lag seconds)
+        self.last_tick = time.monotonic()
+        self.stalls = 0
+        self.active: Dict[int, Tuple[str, float]] = {}  # running watched handlers: id -> (label, start)
+        self._ids = itertools.count()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """Start the probe on the running loop and the watchdog thread"""
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.stopping.clear()
+        self.task = asyncio.get_running_loop().create_task(self._probe())
+        if self.watchdog_threshold > 0:
+            self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+
+    async def stop(self):
+        self.stopping.set()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.watchdog is not None:
+            self.watchdog.join(timeout=1)
+            self.watchdog = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    async def _probe(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.samples.append((now, max(0.0, now - expected)))
+            self.last_tick = now
+
+    def stalled_for(self) -> float:
+        """Seconds the loop has been blocked right now (0 while the probe keeps ticking)"""
+        if not self.running:
+            return 0.0
+        return max(0.0, time.monotonic() - self.last_tick - self.interval)
+
+    def active_handlers(self) -> List[str]:
+        now = time.monotonic()
+        return [f"{label} ({now - start:.1f}s)" for label, start in list(self.active.values())]
+
+    def _watch(self):
+        reported_tick = None
+        while not self.stopping.wait(min(self.watchdog_threshold / 4, 0.25)):
+            tick = self.last_tick
+            stalled = self.stalled_for()
+            if stalled < self.watchdog_threshold or tick == reported_tick:
+                continue
+            # Report each stall once, while it is still happening
+            reported_tick = tick
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(stack unavailable)\n"
+            handlers = ", ".join(self.active_handlers()) or "none"
+            logger.warning(f"Event loop blocked for {stalled:.1f}s; active handlers: {handlers}\n{stack}")
+
+    def lag_percentiles(self, seconds: Optional[float] = None) -> Dict[str, float]:
+        """Lag percentiles in milliseconds over the whole window or the last `seconds`"""
+        since = time.monotonic() - seconds if seconds else None
+        lags = [lag for at, lag in list(self.samples) if since is None or at >= since]
+        return {
+            "count": len(lags),
+            "p50": round(percentile(lags, 50) * 1000, 1),
+            "p95": round(percentile(lags, 95) * 1000, 1),
+            "p99": round(percentile(lags, 99) * 1000, 1),
+            "max": round(max(lags) * 1000, 1) if lags else 0.0,
+        }
+
+    def health(self) -> Dict[str, Any]:
+        """Status for the health endpoint: degraded when p99 lag or the current stall is too high"""
+        lag = self.lag_percentiles()
+        stalled = self.stalled_for()
+        degraded = lag["p99"] > self.degraded_ms or (self.watchdog_threshold > 0 and stalled > self.watchdog_threshold)
+        return {
+            "status": "degraded" if degraded else "ok",
+            "lag_ms": lag,
+            "stalled_seconds": round(stalled, 2),
+            "stalls": self.stalls,
+            "active_handlers": self.active_handlers(),
+        }
+
+    @contextmanager
+    def track(self, label: str):
+        """Mark a handler as running so the watchdog can name it"""
+        token = next(self._ids)
+        self.active[token] = (label, time.monotonic())
+        try:
+            yield
+        finally:
+            self.active.pop(token, None)
+
+    def watched(self, func):
+        """Decorator tracking a sync or async function under its qualified name"""
+        label = func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.track(label):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.track(label):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+# Shared by the bot's handlers, the parse worker and the health endpoint
+monitor = LoopLagMonitor()
+watched = monitor.watched
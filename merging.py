@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Incremental Question Merging
+دمج الأسئلة تدريجياً مع حذف المكرر وإعادة الترقيم
+"""
+
+from typing import List, Dict, Any, Tuple
+from normalize import normalize_many, LIGHT
+
+
+class MergeAccumulator:
+    """Running merged question list that validates, de-duplicates and renumbers as files arrive"""
+
+    def __init__(self):
+        self.questions: List[Dict[str, Any]] = []
+        self.keys: List[Tuple] = []  # question_key of each merged question, so state reloads skip normalization
+        self.seen: set = set()
+        self.duplicates = 0
+        self.invalid = 0
+
+    @staticmethod
+    def question_keys(questions: List[Dict[str, Any]]) -> List[Tuple]:
+        """Identities used for de-duplication, with every text of the batch normalized in one pass"""
+        texts, spans = [], []
+        for question in questions:
+            choices = [str(choice) for choice in question.get('choices') or []]
+            spans.append((len(texts), len(choices)))
+            texts.extend([str(question.get('question', '')), str(question.get('passage', ''))] + choices)
+        texts = normalize_many(texts, LIGHT)
+        return [(texts[start], tuple(texts[start + 2:start + 2 + count]), texts[start + 1]) for start, count in spans]
+
+    @classmethod
+    def question_key(cls, question: Dict[str, Any]) -> Tuple:
+        """Identity of a question used for de-duplication"""
+        return cls.question_keys([question])[0]
+
+    @staticmethod
+    def is_valid(question: Any) -> bool:
+        """Check that an item looks like an extracted question"""
+        if not isinstance(question, dict):
+            return False
+        text = question.get('question')
+        if not isinstance(text, str) or not text.strip():
+            return False
+        choices = question.get('choices', [])
+        return isinstance(choices, list)
+
+    def add_questions(self, questions: List[Any]) -> Dict[str, int]:
+        """Fold a file's questions into the merged list and return per-file counts"""
+        valid = [question for question in questions if self.is_valid(question)]
+        stats = {'added': 0, 'duplicates': 0, 'invalid': len(questions) - len(valid)}
+        for question, key in zip(valid, self.question_keys(valid)):
+            if key in self.seen:
+                stats['duplicates'] += 1
+                continue
+
+            self.seen.add(key)
+            self.keys.append(key)
+            question_copy = question.copy()
+            question_copy['question_number'] = len(self.questions) + 1
+            self.questions.append(question_copy)
+            stats['added'] += 1
+
+        self.duplicates += stats['duplicates']
+        self.invalid += stats['invalid']
+        return stats
+
+    def result(self) -> List[Dict[str, Any]]:
+        """Merged, renumbered questions"""
+        return self.questions
+
+    def record_since(self, start: int, stats: Dict[str, int]) -> Dict[str, Any]:
+        """JSON-serializable record of the questions merged after `start`, for add_record in another process"""
+        return {
+            'questions': self.questions[start:],
+            'keys': [[text, list(choices), passage] for text, choices, passage in self.keys[start:]],
+            'duplicates': stats['duplicates'],
+            'invalid': stats['invalid'],
+        }
+
+    def add_record(self, record: Dict[str, Any]):
+        """Replay a record_since() record; costs only the size of the record"""
+        keys = [(text, tuple(choices), passage) for text, choices, passage in record['keys']]
+        self.questions.extend(record['questions'])
+        self.keys.extend(keys)
+        self.seen.update(keys)
+        self.duplicates += record.get('duplicates', 0)
+        self.invalid += record.get('invalid', 0)
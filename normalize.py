@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Arabic Text Normalization
+توحيد النصوص العربية لمطابقة الإجابة مع الاختيارات
+
+Two precompiled str.translate tables:
+- LIGHT removes only what is never meaningful (tatweel, zero-width and
+  direction marks, odd spaces); used to drop duplicate choices.
+- FULL also strips diacritics and unifies alef forms and digits; used to match
+  an answer to its choice when the match is unambiguous, since some exam
+  choices differ only in their diacritics.
+
+Texts are normalized in batches: all strings of a document are joined, passed
+through translate and the whitespace regex once, and split again.
+"""
+
+import re
+from typing import List, Dict, Any, Optional, Iterable
+
+SEPARATOR = "\x00"
+
+_INVISIBLE = ["\u0640", "\u00ad", "\u061c", "\ufeff"]  # tatweel, soft hyphen, arabic letter mark, BOM
+_INVISIBLE += [chr(c) for c in range(0x200B, 0x2010)]  # zero-width chars, LRM/RLM
+_INVISIBLE += [chr(c) for c in range(0x202A, 0x202F)]  # bidi embeddings and overrides
+_INVISIBLE += [chr(c) for c in range(0x2066, 0x206A)]  # bidi isolates
+_SPACES = ["\u00a0", "\u1680", "\u202f", "\u205f", "\u3000"] + [chr(c) for c in range(0x2000, 0x200B)]
+
+_DIACRITICS = [chr(c) for c in range(0x064B, 0x0660)] + ["\u0670"]  # harakat, tanween, shadda, sukun, dagger alef
+_DIACRITICS += [chr(c) for c in range(0x06D6, 0x06EE) if c not in (0x06DD, 0x06DE, 0x06E5, 0x06E6, 0x06E9)]
+_ALEF = {"\u0622": "\u0627", "\u0623": "\u0627", "\u0625": "\u0627", "\u0671": "\u0627"}  # آ أ إ ٱ -> ا
+_DIGITS = {chr(0x0660 + i): str(i) for i in range(10)}
+_DIGITS.update({chr(0x06F0 + i): str(i) for i in range(10)})
+
+LIGHT = str.maketrans({**{c: None for c in _INVISIBLE}, **{c: " " for c in _SPACES}})
+FULL = str.maketrans({
+    **{c: None for c in _INVISIBLE + _DIACRITICS},
+    **{c: " " for c in _SPACES},
+    **_ALEF,
+    **_DIGITS,
+})
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_many(texts: List[str], table: dict = FULL) -> List[str]:
+    """Normalize a batch of strings with one translate and one regex pass"""
+    if not texts:
+        return []
+    joined = SEPARATOR.join(texts)
+    if joined.count(SEPARATOR) != len(texts) - 1:
+        # A text contains the separator itself; fall back to one pass per text
+        return [_WHITESPACE.sub(" ", text.translate(table)).strip() for text in texts]
+    joined = _WHITESPACE.sub(" ", joined.translate(table))
+    return [part.strip() for part in joined.split(SEPARATOR)]
+
+
+def normalize(text: str, table: dict = FULL) -> str:
+    return normalize_many([text], table)[0]
+
+
+def _unique_keys(keys: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Map each key to its choice index, or None when several choices share it"""
+    index: Dict[str, Optional[int]] = {}
+    for i, key in enumerate(keys):
+        index[key] = None if key in index else i
+    return index
+
+
+def annotate_answers(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop duplicate choices and set answer_index on every question in one batch pass"""
+    texts: List[str] = []
+    for question in questions:
+        texts.extend(question.get("choices") or [])
+        texts.append(question.get("answer") or "")
+
+    light = normalize_many(texts, LIGHT)
+    full = normalize_many(light, FULL)
+
+    position = 0
+    for question in questions:
+        raw_choices = question.get("choices") or []
+        count = len(raw_choices)
+        light_choices = light[position:position + count]
+        full_choices = full[position:position + count]
+        light_answer = light[position + count]
+        full_answer = full[position + count]
+        position += count + 1
+
+        # Choices that only differ by invisible characters or spacing are the same choice
+        seen = set()
+        kept = []
+        for i, key in enumerate(light_choices):
+            if key not in seen:
+                seen.add(key)
+                kept.append(i)
+        if len(kept) != count:
+            question["choices"] = [raw_choices[i] for i in kept]
+            light_choices = [light_choices[i] for i in kept]
+            full_choices = [full_choices[i] for i in kept]
+
+        answer_index = None
+        if light_answer:
+            answer_index = _unique_keys(light_choices).get(light_answer)
+            if answer_index is None:
+                answer_index = _unique_keys(full_choices).get(full_answer)
+        question["answer_index"] = answer_index
+
+    return questions
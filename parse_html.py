@@ -7,14 +7,28 @@ HTML Results Parser
 import json
 import argparse
 import sys
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+from formats import FORMATS, DEFAULT_FORMAT, available_formats, save_questions, with_format_extension
+from normalize import annotate_answers
+
+# BeautifulSoup tree builders the extractor can run on; html.parser is the reference
+PARSER_BACKENDS = ["html.parser", "lxml", "html5lib"]
+
+
+def available_backends() -> List[str]:
+    """Parser backends whose libraries are installed"""
+    return [name for name in PARSER_BACKENDS if builder_registry.lookup(name) is not None]
 
 
 class HTMLResultsParser:
-    def __init__(self):
+    def __init__(self, backend: str = "html.parser"):
         self.questions: List[Dict[str, Any]] = []
         self.current_passage: str = ""
+        self.containers_done = 0
+        self.containers_total = 0
+        self.backend = backend
     
     def parse_html_file(self, html_file_path: str, category: str) -> List[Dict[str, Any]]:
         """Parse HTML file and extract questions with correct answers"""
@@ -41,54 +55,11 @@ class HTMLResultsParser:
     def parse_html_content(self, html_content: str, category: str) -> List[Dict[str, Any]]:
         """Parse HTML content and extract questions with correct answers"""
         try:
-            # Clear previous questions for each new file
-            self.questions = []
-            self.current_passage = ""
-            
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Extract form title
-            form_title = self.extract_form_title(soup)
-            print(f"Form title: {form_title}")
-            
-            # Find all question containers
-            question_containers = soup.find_all('div', class_='Qr7Oae', role='listitem')
-            
-            if not question_containers:
-                print("No question containers found. Trying alternative selectors...")
-                # Try alternative selectors
-                question_containers = soup.find_all('div', role='listitem')
+            for _ in self.iter_questions(html_content, category):
+                pass
             
-            if not question_containers:
-                print("Error: No question containers found")
-                return []
-            
-            print(f"Found {len(question_containers)} question containers")
-            
-            # Extract questions
-            question_number = 1
-            for i, container in enumerate(question_containers):
-                try:
-                    # Check if this is a passage (for reading comprehension)
-                    if category == "استيعاب المقروء":
-                        passage_text = self.extract_passage_text(container)
-                        if passage_text:
-                            self.current_passage = passage_text
-                            print(f"Found passage: {passage_text[:100]}...")
-                            continue
-                    
-                    question_data = self.extract_question_from_container(container, question_number, category)
-                    if question_data:
-                        question_data["exam"] = form_title
-                        question_data["category"] = category
-                        if category == "استيعاب المقروء" and self.current_passage:
-                            question_data["passage"] = self.current_passage
-                        self.questions.append(question_data)
-                        print(f"Question {question_number}: {question_data['question']} -> Answer: {question_data['answer']}")
-                        question_number += 1
-                except Exception as e:
-                    print(f"Error extracting question {question_number}: {e}")
-                    continue
+            # Normalize all choices and answers of the document in one pass
+            annotate_answers(self.questions)
             
             print(f"Total questions extracted: {len(self.questions)}")
             return self.questions
@@ -97,6 +68,70 @@ class HTMLResultsParser:
             print(f"Error parsing HTML content: {e}")
             return self.questions
     
+    def iter_questions(self, html_content: str, category: str) -> Iterator[Dict[str, Any]]:
+        """Yield questions as containers are processed; progress is in containers_done / containers_total
+        
+        Yielded questions are not normalized yet: answer_index is set by annotate_answers
+        once the batch (or the whole document) is available.
+        """
+        # Clear previous questions for each new file
+        self.questions = []
+        self.current_passage = ""
+        self.containers_done = 0
+        self.containers_total = 0
+        
+        soup = BeautifulSoup(html_content, self.backend)
+        
+        # Extract form title
+        form_title = self.extract_form_title(soup)
+        print(f"Form title: {form_title}")
+        
+        # Find all question containers
+        question_containers = soup.find_all('div', class_='Qr7Oae', role='listitem')
+        
+        if not question_containers:
+            print("No question containers found. Trying alternative selectors...")
+            # Try alternative selectors
+            question_containers = soup.find_all('div', role='listitem')
+        
+        if not question_containers:
+            print("Error: No question containers found")
+            return
+        
+        print(f"Found {len(question_containers)} question containers")
+        self.containers_total = len(question_containers)
+        
+        # Extract questions
+        question_number = 1
+        for i, container in enumerate(question_containers):
+            question_data = None
+            try:
+                # Check if this is a passage (for reading comprehension)
+                if category == "استيعاب المقروء":
+                    passage_text = self.extract_passage_text(container)
+                    if passage_text:
+                        self.current_passage = passage_text
+                        print(f"Found passage: {passage_text[:100]}...")
+                        continue
+                
+                question_data = self.extract_question_from_container(container, question_number, category)
+                if question_data:
+                    question_data["exam"] = form_title
+                    question_data["category"] = category
+                    if category == "استيعاب المقروء" and self.current_passage:
+                        question_data["passage"] = self.current_passage
+                    self.questions.append(question_data)
+                    print(f"Question {question_number}: {question_data['question']} -> Answer: {question_data['answer']}")
+                    question_number += 1
+            except Exception as e:
+                print(f"Error extracting question {question_number}: {e}")
+                question_data = None
+            finally:
+                self.containers_done = i + 1
+            
+            if question_data:
+                yield question_data
+    
     def extract_form_title(self, soup) -> str:
         """Extract form title from soup"""
         try:
@@ -216,6 +251,7 @@ class HTMLResultsParser:
     def extract_choices(self, container) -> List[str]:
         """Extract all choices from container"""
         choices = []
+        seen = set()
         try:
             # Find radiogroup
             radiogroup = container.select_one('[role="radiogroup"]')
@@ -227,7 +263,8 @@ class HTMLResultsParser:
                     choice_span = label.select_one('.aDTYNe')
                     if choice_span:
                         choice_text = choice_span.get_text().strip()
-                        if choice_text and choice_text not in choices:
+                        if choice_text and choice_text not in seen:
+                            seen.add(choice_text)
                             choices.append(choice_text)
             
             return choices
@@ -281,7 +318,19 @@ class HTMLResultsParser:
 
 
 def main():
+    arg_parser = argparse.ArgumentParser(description="استخراج الأسئلة من ملف HTML لصفحة النتائج")
+    arg_parser.add_argument("--html", help="ملف HTML")
+    arg_parser.add_argument("--output", help="ملف الإخراج")
+    arg_parser.add_argument("--category", choices=["1", "2", "3", "4", "5"], help="رقم القسم (1-5)")
+    arg_parser.add_argument("--format", dest="output_format", default=DEFAULT_FORMAT,
+                            choices=list(FORMATS), help="صيغة ملف الإخراج")
+    args = arg_parser.parse_args()
+    
     try:
+        if args.output_format not in available_formats():
+            print(f"خطأ: الصيغة {args.output_format} تحتاج إلى مكتبة غير مثبتة")
+            sys.exit(1)
+        
         # Display category options
         categories = {
             "1": "التناظر اللفظي",
@@ -291,47 +340,50 @@ def main():
             "5": "المفردة الشاذة"
         }
         
-        print("="*50)
-        print("أهلاً بك في أداة استخراج الأسئلة من HTML")
-        print("="*50)
-        print("اختر نوع القسم:")
-        for key, value in categories.items():
-            print(f"{key}. {value}")
-        print("="*50)
-        
-        # Get category choice from user
-        while True:
-            choice = input("أدخل رقم القسم (1-5): ").strip()
-            if choice in categories:
-                category = categories[choice]
-                break
-            else:
-                print("خطأ: الرقم غير صحيح. يرجى اختيار رقم من 1 إلى 5")
+        if args.category:
+            category = categories[args.category]
+        else:
+            print("="*50)
+            print("أهلاً بك في أداة استخراج الأسئلة من HTML")
+            print("="*50)
+            print("اختر نوع القسم:")
+            for key, value in categories.items():
+                print(f"{key}. {value}")
+            print("="*50)
+            
+            # Get category choice from user
+            while True:
+                choice = input("أدخل رقم القسم (1-5): ").strip()
+                if choice in categories:
+                    category = categories[choice]
+                    break
+                else:
+                    print("خطأ: الرقم غير صحيح. يرجى اختيار رقم من 1 إلى 5")
         
         print(f"تم اختيار: {category}")
         
         # Get HTML file path from user
-        html_file = input("أدخل اسم ملف HTML: ").strip()
+        html_file = args.html or input("أدخل اسم ملف HTML: ").strip()
         if not html_file:
             print("خطأ: يجب إدخال اسم ملف HTML")
             sys.exit(1)
         
         # Get output file path from user
-        output_file = input("أدخل اسم ملف الإخراج (JSON): ").strip()
+        output_file = args.output or input("أدخل اسم ملف الإخراج: ").strip()
         if not output_file:
             print("خطأ: يجب إدخال اسم ملف الإخراج")
             sys.exit(1)
         
-        # Add .json extension if not provided
-        if not output_file.endswith('.json'):
-            output_file += '.json'
+        # Add the format extension if not provided
+        extension = FORMATS[args.output_format]['extension']
+        if not output_file.endswith(extension):
+            output_file = with_format_extension(output_file, args.output_format)
         
         html_parser = HTMLResultsParser()
         questions = html_parser.parse_html_file(html_file, category)
         
-        # Save to JSON file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(questions, f, ensure_ascii=False, indent=2)
+        # Save in the chosen format
+        save_questions(questions, output_file, args.output_format)
         
         print(f"تم حفظ النتائج في {output_file}")
         print(f"إجمالي الأسئلة: {len(questions)}")
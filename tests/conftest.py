@@ -0,0 +1,37 @@
+import os
+from collections import defaultdict
+
+import pytest
+
+# Optional speed gate, e.g. MIN_QUESTIONS_PER_SECOND=100 python -m pytest tests
+MIN_QUESTIONS_PER_SECOND = float(os.getenv("MIN_QUESTIONS_PER_SECOND", 0))
+
+_throughput = defaultdict(lambda: {"questions": 0, "bytes": 0, "seconds": 0.0})
+
+
+@pytest.fixture
+def throughput():
+    """Record an engine run so speed is reported (and gated) next to correctness"""
+    def record(engine_name, questions, html_content, seconds):
+        stats = _throughput[engine_name]
+        stats["questions"] += len(questions)
+        stats["bytes"] += len(html_content.encode("utf-8"))
+        stats["seconds"] += seconds
+        if MIN_QUESTIONS_PER_SECOND and questions and seconds:
+            rate = len(questions) / seconds
+            assert rate >= MIN_QUESTIONS_PER_SECOND, (
+                f"{engine_name} extracted {rate:.1f} questions/s, below {MIN_QUESTIONS_PER_SECOND}"
+            )
+    return record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _throughput:
+        return
+    terminalreporter.section("extraction throughput")
+    for engine_name, stats in sorted(_throughput.items()):
+        seconds = stats["seconds"] or float("inf")
+        terminalreporter.write_line(
+            f"{engine_name:20} {stats['questions']:6d} questions "
+            f"{stats['questions'] / seconds:10.1f} q/s {stats['bytes'] / seconds / 1e6:8.2f} MB/s"
+        )
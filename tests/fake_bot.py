@@ -0,0 +1,40 @@
+"""
+Fake Telegram bot for delivery and worker tests
+بوت وهمي يسجل استدعاءات Bot API بدلاً من إرسالها
+"""
+
+import time
+
+
+class FakeBot:
+    """Records the Bot API calls made through DeliveryQueue as (method, kwargs, time)
+
+    errors maps a method to exceptions raised by its next calls in order;
+    a None entry lets that call succeed.
+    """
+
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = errors or {}
+
+    async def _call(self, method, kwargs):
+        self.calls.append((method, kwargs, time.monotonic()))
+        if self.errors.get(method):
+            error = self.errors[method].pop(0)
+            if error is not None:
+                raise error
+
+    async def send_message(self, **kwargs):
+        await self._call("send_message", kwargs)
+
+    async def edit_message_text(self, **kwargs):
+        await self._call("edit_message_text", kwargs)
+
+    async def send_document(self, **kwargs):
+        await self._call("send_document", kwargs)
+
+    def texts(self, method):
+        return [kwargs["text"] for called, kwargs, _ in self.calls if called == method]
+
+    def documents(self):
+        return [kwargs for method, kwargs, _ in self.calls if method == "send_document"]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Golden Output Harness
+تشغيل محركات الاستخراج على صفحات العينة ومقارنتها بالمخرجات المرجعية
+
+Run `python tests/harness.py --update` to regenerate the golden files after an
+intended change of extractor output, or without arguments to print throughput.
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+from functools import partial
+from typing import List, Dict, Any, Callable, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from parse_html import HTMLResultsParser, PARSER_BACKENDS, available_backends  # noqa: E402
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# Sample pages shipped with the repo and the category they are parsed as
+SAMPLES = [
+    {"id": "analogy_3", "html": "التناظر 3.html", "category": "التناظر اللفظي"},
+    {"id": "reading_comprehension", "html": "استيعاب المقروء.html", "category": "استيعاب المقروء"},
+]
+
+# The engine whose output is frozen as golden; others must match it up to whitespace
+REFERENCE_ENGINE = "bs4:html.parser"
+
+
+def _bs4_engine(backend: str, html_content: str, category: str) -> List[Dict[str, Any]]:
+    return HTMLResultsParser(backend=backend).parse_html_content(html_content, category)
+
+
+def engine_names() -> List[str]:
+    """Every known engine, installed or not"""
+    return [f"bs4:{backend}" for backend in PARSER_BACKENDS]
+
+
+def engines() -> Dict[str, Callable[[str, str], List[Dict[str, Any]]]]:
+    """Installed engines: name -> callable(html_content, category)"""
+    return {f"bs4:{backend}": partial(_bs4_engine, backend) for backend in available_backends()}
+
+
+def run_engine(engine: Callable, html_content: str, category: str) -> Tuple[List[Dict[str, Any]], float]:
+    """Run an engine quietly and return its questions and wall time"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        questions = engine(html_content, category)
+        elapsed = time.perf_counter() - start
+    return questions, elapsed
+
+
+def normalize_whitespace(value: Any) -> Any:
+    """Collapse whitespace in all strings so tree builders that keep extra newlines compare equal"""
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, list):
+        return [normalize_whitespace(item) for item in value]
+    if isinstance(value, dict):
+        return {key: normalize_whitespace(item) for key, item in value.items()}
+    return value
+
+
+def read_sample(sample: Dict[str, str]) -> str:
+    with open(os.path.join(ROOT, sample["html"]), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def golden_path(sample: Dict[str, str]) -> str:
+    return os.path.join(GOLDEN_DIR, f"{sample['id']}.json")
+
+
+def load_golden(sample: Dict[str, str]) -> List[Dict[str, Any]]:
+    with open(golden_path(sample), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def update_goldens():
+    """Freeze the reference engine's current output for every sample page"""
+    engine = engines()[REFERENCE_ENGINE]
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for sample in SAMPLES:
+        questions, _ = run_engine(engine, read_sample(sample), sample["category"])
+        with open(golden_path(sample), "w", encoding="utf-8") as f:
+            json.dump(questions, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"{sample['id']}: {len(questions)} questions -> {golden_path(sample)}")
+
+
+def report_throughput(repeat: int = 5):
+    """Print questions per second and MB per second of every engine on the sample pages"""
+    for name, engine in engines().items():
+        total_questions = 0
+        total_bytes = 0
+        total_seconds = 0.0
+        for sample in SAMPLES:
+            html_content = read_sample(sample)
+            for _ in range(repeat):
+                questions, elapsed = run_engine(engine, html_content, sample["category"])
+                total_questions += len(questions)
+                total_bytes += len(html_content.encode("utf-8"))
+                total_seconds += elapsed
+        print(f"{name:20} {total_questions / total_seconds:10.1f} q/s "
+              f"{total_bytes / total_seconds / 1e6:8.2f} MB/s")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Golden output harness for the HTML extractor")
+    arg_parser.add_argument("--update", action="store_true", help="regenerate golden files")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs per sample for throughput")
+    args = arg_parser.parse_args()
+
+    if args.update:
+        update_goldens()
+    else:
+        report_throughput(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
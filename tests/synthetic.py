@@ -0,0 +1,121 @@
+"""
+Synthetic Google Forms result pages for differential testing
+صفحات نتائج اصطناعية لمقارنة محركات الاستخراج
+"""
+
+import random
+from html import escape
+from typing import List, Dict, Any, Tuple
+
+CATEGORIES = ["التناظر اللفظي", "إكمال الجمل", "استيعاب المقروء", "الخطأ السياقي", "المفردة الشاذة"]
+
+WORDS = [
+    "غابة", "أسد", "عش", "عصفور", "سفينة", "قبطان", "نهر", "رمل", "طائرة", "مسافر",
+    "الحرارة", "البرق", "الشمس", "الوقت", "العمل", "التنمية", "النمو", "البيئة", "الحل", "الطريق",
+    "كتاب", "قلم", "مدرسة", "معلم", "طالب", "بحر", "سماء", "مطر", "زهرة", "شجرة",
+]
+
+LABEL_TEMPLATE = (
+    '<label class="docssharedWizToggleLabeledContainer O4MBef"><div class="bzfPab wFGF8">'
+    '<div class="Od2TWd hYsg7c" role="radio"></div>'
+    '<div class="YEVVod"><div class="ulDsOb"><span class="aDTYNe snByac">{text}</span></div></div>'
+    '</div>{marker}</label>'
+)
+CORRECT_MARKER = '<div class="H6Scae" role="note"><div class="fKfAyc">إجابة صحيحة</div></div>'
+
+
+def _phrase(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _container(inner: str) -> str:
+    return f'<div class="Qr7Oae" role="listitem"><div class="OxAavc">{inner}</div></div>'
+
+
+def _heading(text: str) -> str:
+    return f'<div class="cTDvob D1wxyf RjsPE" role="heading"><span class="M7eMe">{escape(text)}</span></div>'
+
+
+def _textbox_item(text: str) -> str:
+    return _container(_heading(text) + '<div class="Ih4Dzb"><div class="q4tvle" role="textbox"></div></div>')
+
+
+def _question_item(rng: random.Random, question: str, choices: List[str], answer_index: int, style: str,
+                   answer_text: str) -> str:
+    labels = []
+    for i, choice in enumerate(choices):
+        marker = CORRECT_MARKER if style == "marked" and i == answer_index else ""
+        labels.append(LABEL_TEMPLATE.format(text=escape(choice), marker=marker))
+    # Occasionally repeat a choice; the extractor must drop the duplicate
+    if rng.random() < 0.2:
+        labels.append(LABEL_TEMPLATE.format(text=escape(rng.choice(choices)), marker=""))
+
+    inner = _heading(question) + '<div class="lLfZXe" role="radiogroup"><span role="presentation">'
+    inner += "".join(f'<div class="yUJIWb">{label}</div>' for label in labels)
+    inner += "</span></div>"
+    if style == "d42":
+        # Wrong answer given: the correct one is shown in a separate block
+        inner += (
+            '<div class="D42QGf"><div class="fD9txe" role="heading">الإجابة الصحيحة</div>'
+            '<div class="muwQbd"><div class="fiH1oe">'
+            + LABEL_TEMPLATE.format(text=escape(answer_text), marker="")
+            + "</div></div></div>"
+        )
+    return _container(inner)
+
+
+def build_page(seed: int) -> Tuple[str, str, List[Dict[str, Any]]]:
+    """Build a random result page; returns (html, category, expected questions)"""
+    rng = random.Random(seed)
+    category = rng.choice(CATEGORIES)
+    is_rc = category == "استيعاب المقروء"
+    title = f"الاختبار {seed} ({category})"
+
+    items = [_textbox_item("اسم الطالب :")]
+    expected = []
+    passage = ""
+    used_questions = set()
+
+    for _ in range(rng.randint(1, 12)):
+        if is_rc and (not passage or rng.random() < 0.3):
+            passage = _phrase(rng, 15, 40)
+            items.append(_textbox_item(passage))
+
+        question = _phrase(rng, 2, 8)
+        while question in used_questions or question in ("اسم الطالب", "الاختبار"):
+            question = _phrase(rng, 2, 8)
+        used_questions.add(question)
+
+        choices = []
+        while len(choices) < rng.randint(2, 6):
+            choice = _phrase(rng, 1, 3)
+            if choice not in choices:
+                choices.append(choice)
+        answer_index = rng.randrange(len(choices))
+        style = rng.choice(["marked", "d42", "none"])
+        answer_text = choices[answer_index]
+        if style == "d42" and rng.random() < 0.3:
+            # The correct-answer block sometimes differs from the choice by tatweel
+            answer_text = answer_text[:1] + "\u0640" + answer_text[1:]
+
+        items.append(_question_item(rng, question, choices, answer_index, style, answer_text))
+        entry = {
+            "question_number": len(expected) + 1,
+            "question": question,
+            "type": "اختيار",
+            "choices": choices,
+            "answer": answer_text if style != "none" else "",
+            "answer_index": answer_index if style != "none" else None,
+            "exam": title,
+            "category": category,
+        }
+        if is_rc:
+            entry["passage"] = passage
+        expected.append(entry)
+
+    html_content = (
+        '<!DOCTYPE html><html dir="rtl"><head><meta charset="utf-8"><title>نتائج</title></head><body>'
+        f'<div class="F9yp7e ikZYwf LgNcQe" role="heading" aria-level="1"><b><i>{escape(title)}</i></b></div>'
+        '<div role="list">' + "".join(items) + "</div></body></html>"
+    )
+    return html_content, category, expected
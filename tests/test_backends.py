@@ -0,0 +1,134 @@
+import time
+
+import pytest
+
+from backends import (
+    MemorySessionStore, SqliteSessionStore, MemoryJobQueue, SqliteJobQueue, MemoryBlobStore, FileBlobStore,
+    MemoryMessageQueue, SqliteMessageQueue
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def stores(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore(), MemoryJobQueue(lease_seconds=0.2, max_attempts=2)
+    db = str(tmp_path / "state.sqlite3")
+    return SqliteSessionStore(db), SqliteJobQueue(db, lease_seconds=0.2, max_attempts=2)
+
+
+def test_session_store_roundtrip(stores):
+    sessions, _ = stores
+    assert sessions.get("session:1") is None
+    sessions.set("session:1", {"mode": "merge", "merge_id": "abc"})
+    value = sessions.get("session:1")
+    value["mode"] = "changed"
+    assert sessions.get("session:1") == {"mode": "merge", "merge_id": "abc"}
+    sessions.delete("session:1")
+    assert sessions.get("session:1") is None
+
+
+def test_jobs_in_a_group_run_in_order(stores):
+    _, jobs = stores
+    jobs.put({"n": 1}, group="a")
+    jobs.put({"n": 2}, group="a")
+    jobs.put({"n": 3}, group="b")
+
+    first = jobs.claim()
+    second = jobs.claim()
+    assert [first["payload"]["n"], second["payload"]["n"]] == [1, 3]
+    assert jobs.claim() is None  # group "a" is busy
+
+    jobs.ack(first["id"])
+    assert jobs.claim()["payload"]["n"] == 2
+
+
+def test_failed_job_is_retried_then_dropped(stores):
+    _, jobs = stores
+    jobs.put({"n": 1})
+    job = jobs.claim()
+    assert jobs.fail(job["id"]) is True
+    job = jobs.claim()
+    assert job["attempts"] == 2
+    assert jobs.fail(job["id"]) is False
+    assert jobs.claim() is None
+    assert jobs.pending_count() == 0
+
+
+def test_expired_lease_is_claimed_again(stores):
+    _, jobs = stores
+    jobs.put({"n": 1}, group="a")
+    job = jobs.claim()
+    assert jobs.claim() is None
+    time.sleep(0.25)
+    again = jobs.claim()
+    assert again["id"] == job["id"]
+    assert again["attempts"] == 2
+
+
+def test_extended_lease_is_not_claimed_again(stores):
+    _, jobs = stores
+    jobs.put({"n": 1})
+    job = jobs.claim()
+    time.sleep(0.15)
+    assert jobs.extend(job["id"]) is True
+    time.sleep(0.1)
+    assert jobs.claim() is None
+    jobs.ack(job["id"])
+    assert jobs.extend(job["id"]) is False
+
+
+def test_sqlite_queue_is_shared_between_connections(tmp_path):
+    db = str(tmp_path / "state.sqlite3")
+    frontend, worker = SqliteJobQueue(db), SqliteJobQueue(db)
+    frontend.put({"type": "extract"}, group="1")
+    job = worker.claim()
+    assert job["payload"] == {"type": "extract"}
+    assert frontend.claim() is None
+    worker.ack(job["id"])
+    assert frontend.pending_count() == 0
+
+
+@pytest.mark.parametrize("kind", ["memory", "file"])
+def test_blob_store(kind, tmp_path):
+    blobs = MemoryBlobStore() if kind == "memory" else FileBlobStore(str(tmp_path / "blobs"))
+    key = blobs.put(b"data")
+    assert blobs.get(key) == b"data"
+    blobs.put(b"state", key="merge-1.json")
+    assert blobs.get("merge-1.json") == b"state"
+    blobs.delete(key)
+    with pytest.raises(KeyError):
+        blobs.get(key)
+    blobs.delete(key)
+
+
+def test_file_blob_store_rejects_paths(tmp_path):
+    blobs = FileBlobStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        blobs.put(b"x", key="../escape")
+
+
+def test_exhausted_lease_is_deleted(stores):
+    _, jobs = stores
+    jobs.put({"n": 1}, group="a")
+    jobs.claim()
+    time.sleep(0.25)
+    assert jobs.claim()["attempts"] == 2
+    time.sleep(0.25)
+    assert jobs.claim() is None
+    assert jobs.pending_count() == 0
+    jobs.put({"n": 2}, group="a")
+    assert jobs.claim()["payload"] == {"n": 2}
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_message_queue_takes_in_order(kind, tmp_path):
+    if kind == "memory":
+        writer = reader = MemoryMessageQueue()
+    else:
+        writer = SqliteMessageQueue(str(tmp_path / "state.sqlite3"))
+        reader = SqliteMessageQueue(str(tmp_path / "state.sqlite3"))
+    writer.put_many([{"chat_id": 1, "method": "send_message", "kwargs": {"text": str(n)}} for n in range(5)])
+
+    assert [message["kwargs"]["text"] for message in reader.take(limit=3)] == ["0", "1", "2"]
+    assert [message["kwargs"]["text"] for message in reader.take()] == ["3", "4"]
+    assert reader.take() == []
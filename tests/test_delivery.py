@@ -0,0 +1,189 @@
+import time
+import asyncio
+import logging
+
+from telegram.error import RetryAfter, BadRequest
+
+from delivery import DeliveryQueue, StoredOutbox
+from backends import MemoryMessageQueue, MemoryBlobStore
+from fake_bot import FakeBot
+
+
+def deliver(fake_bot, enqueue, **options):
+    """Queue calls synchronously, then wait until the queue drained; returns elapsed seconds"""
+    async def run():
+        outbox = DeliveryQueue(**{"global_rate": 1000, "chat_rate": 1000, "chat_burst": 1000, **options})
+        outbox.start(fake_bot)
+        start = time.monotonic()
+        enqueue(outbox)
+        await outbox.stop()
+        return outbox, time.monotonic() - start
+
+    return asyncio.run(run())
+
+
+def test_retry_after_blocks_the_chat_and_retries():
+    fake_bot = FakeBot({"send_message": [RetryAfter(0.3)]})
+
+    # A slow refill keeps the chat's bucket around after the retry so it can be inspected
+    outbox, _ = deliver(fake_bot, lambda outbox: outbox.send_message(1, "hi"), chat_rate=1, chat_burst=1)
+
+    assert [call[0] for call in fake_bot.calls] == ["send_message", "send_message"]
+    assert fake_bot.calls[1][2] - fake_bot.calls[0][2] >= 0.3
+    assert outbox.chat_buckets[1].blocked_until >= fake_bot.calls[0][2] + 0.3
+
+
+def send_two_chats(fake_bot, first_chat_messages, **options):
+    """Send to chat 1, then to chat 2 once chat 1 got its 429; returns the call times per chat"""
+    async def run():
+        outbox = DeliveryQueue(**{"global_rate": 1000, "chat_rate": 1000, "chat_burst": 1000, **options})
+        outbox.start(fake_bot)
+        for n in range(first_chat_messages):
+            outbox.send_message(1, str(n))
+        await asyncio.sleep(0.05)
+        outbox.send_message(2, "other")
+        await outbox.stop()
+
+    asyncio.run(run())
+    return {chat_id: [at for _, kwargs, at in fake_bot.calls if kwargs["chat_id"] == chat_id] for chat_id in (1, 2)}
+
+
+def test_retry_after_on_an_idle_chat_pauses_every_chat():
+    times = send_two_chats(FakeBot({"send_message": [RetryAfter(0.3)]}), 1)
+
+    assert times[2][0] - times[1][0] >= 0.3
+
+
+def test_retry_after_on_a_busy_chat_pauses_only_that_chat():
+    # The second message used up the chat's burst, so the 429 is the per-chat limit
+    fake_bot = FakeBot({"send_message": [None, RetryAfter(0.3)]})
+    times = send_two_chats(fake_bot, 2, chat_rate=1, chat_burst=2)
+
+    assert times[2][0] - times[1][1] < 0.2
+    assert len(times[1]) == 3
+
+
+def test_idle_chat_buckets_are_dropped():
+    fake_bot = FakeBot()
+
+    async def run():
+        outbox = DeliveryQueue(global_rate=1000, chat_rate=100, chat_burst=1)
+        outbox.start(fake_bot)
+        outbox.send_message(1, "a")
+        await asyncio.sleep(0.1)
+        outbox.send_message(2, "b")
+        await outbox.stop()
+        return outbox
+
+    outbox = asyncio.run(run())
+
+    assert 1 not in outbox.chat_buckets
+    assert len(fake_bot.calls) == 2
+
+
+def test_consecutive_edits_are_coalesced_until_another_call():
+    def enqueue(outbox):
+        outbox.edit_message_text(1, 5, "a")
+        outbox.edit_message_text(1, 5, "b")
+        outbox.send_document(1, b"data", filename="q.json")
+        outbox.edit_message_text(1, 5, "c")
+        outbox.edit_message_text(1, 5, "d")
+
+    fake_bot = FakeBot()
+    deliver(fake_bot, enqueue)
+
+    assert [(method, kwargs.get("text")) for method, kwargs, _ in fake_bot.calls] == [
+        ("edit_message_text", "b"), ("send_document", None), ("edit_message_text", "d")
+    ]
+
+
+def test_messages_of_a_chat_keep_their_order():
+    def enqueue(outbox):
+        for n in range(20):
+            outbox.send_message(n % 2, str(n))
+
+    fake_bot = FakeBot()
+    deliver(fake_bot, enqueue)
+
+    for chat_id in (0, 1):
+        texts = [kwargs["text"] for _, kwargs, _ in fake_bot.calls if kwargs["chat_id"] == chat_id]
+        assert texts == [str(n) for n in range(chat_id, 20, 2)]
+
+
+def test_chat_rate_is_enforced():
+    def enqueue(outbox):
+        for n in range(5):
+            outbox.send_message(1, str(n))
+
+    fake_bot = FakeBot()
+    _, elapsed = deliver(fake_bot, enqueue, chat_rate=10, chat_burst=1)
+
+    assert len(fake_bot.calls) == 5
+    assert elapsed >= 0.35  # first call from the burst, then one every 0.1 s
+
+
+def test_global_rate_is_enforced():
+    def enqueue(outbox):
+        for chat_id in range(10):
+            outbox.send_message(chat_id, "hi")
+
+    fake_bot = FakeBot()
+    _, elapsed = deliver(fake_bot, enqueue, global_rate=5)
+
+    assert len(fake_bot.calls) == 10
+    assert elapsed >= 0.9  # a burst of 5, then one every 0.2 s across all chats
+
+
+def test_global_tokens_are_handed_out_in_arrival_order():
+    def enqueue(outbox):
+        for chat_id in range(15):
+            outbox.send_message(chat_id, "hi")
+
+    fake_bot = FakeBot()
+    deliver(fake_bot, enqueue, global_rate=10)
+
+    assert [kwargs["chat_id"] for _, kwargs, _ in fake_bot.calls] == list(range(15))
+
+
+def test_message_not_modified_is_swallowed(caplog):
+    fake_bot = FakeBot({"edit_message_text": [BadRequest("Message is not modified: specified new message content")]})
+
+    def enqueue(outbox):
+        outbox.edit_message_text(1, 5, "same")
+        outbox.send_message(1, "next")
+
+    with caplog.at_level(logging.WARNING, logger="delivery"):
+        deliver(fake_bot, enqueue)
+
+    assert [call[0] for call in fake_bot.calls] == ["edit_message_text", "send_message"]
+    assert caplog.records == []
+
+
+def test_worker_messages_are_relayed_in_order_after_the_front_end():
+    fake_bot = FakeBot()
+    messages, blobs = MemoryMessageQueue(), MemoryBlobStore()
+
+    async def run():
+        outbox = DeliveryQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        outbox.start(fake_bot)
+        # Front end shows the processing state, then a separate worker reports the result
+        outbox.edit_message_text(1, 5, "⏳")
+        stored = StoredOutbox(messages, blobs)
+        stored.edit_message_text(1, 5, "✅")
+        stored.send_document(1, b"data", filename="q.json")
+        await stored.flush()
+        assert blobs.blobs
+
+        relay = asyncio.create_task(outbox.relay(messages, blobs, poll_interval=0.01))
+        while not any(call[0] == "send_document" for call in fake_bot.calls):
+            await asyncio.sleep(0.01)
+        relay.cancel()
+        await outbox.stop()
+
+    asyncio.run(run())
+
+    assert [(method, kwargs.get("text")) for method, kwargs, _ in fake_bot.calls][-2:] == [
+        ("edit_message_text", "✅"), ("send_document", None)
+    ]
+    assert fake_bot.calls[-1][1]["document"] == b"data"
+    assert not blobs.blobs
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from harness import REFERENCE_ENGINE, engine_names, engines, run_engine, normalize_whitespace
+from synthetic import build_page
+
+FUZZ_PAGES = int(os.getenv("FUZZ_PAGES", 30))
+
+
+@pytest.mark.parametrize("engine_name", engine_names())
+@pytest.mark.parametrize("seed", range(FUZZ_PAGES))
+def test_engine_on_synthetic_page(engine_name, seed, throughput):
+    engine = engines().get(engine_name)
+    if engine is None:
+        pytest.skip(f"{engine_name} is not installed")
+
+    html_content, category, expected = build_page(seed)
+    questions, seconds = run_engine(engine, html_content, category)
+
+    assert normalize_whitespace(questions) == normalize_whitespace(expected)
+    if engine_name != REFERENCE_ENGINE:
+        reference, _ = run_engine(engines()[REFERENCE_ENGINE], html_content, category)
+        assert normalize_whitespace(questions) == normalize_whitespace(reference)
+    throughput(engine_name, questions, html_content, seconds)
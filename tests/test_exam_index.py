@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+
+from exam_index import export_index, build_index
+from harness import SAMPLES, load_golden
+
+
+def all_golden_questions():
+    return [question for sample in SAMPLES for question in load_golden(sample)]
+
+
+def test_index_groups_types_exams_and_passages(tmp_path):
+    questions = all_golden_questions()
+    export_index(questions, str(tmp_path))
+
+    with open(tmp_path / "index.json", encoding="utf-8") as f:
+        index = json.load(f)
+    with open(tmp_path / "passages.json", encoding="utf-8") as f:
+        passages = json.load(f)
+
+    assert set(index["types"]) == {"analogy", "rc"}
+    assert sum(len(ids) for ids in index["types"].values()) == len(questions)
+    assert sum(len(ids) for ids in index["exams"].values()) == len(questions)
+
+    rc = {}
+    for path in index["shards"]["rc"]:
+        with open(tmp_path / path, encoding="utf-8") as f:
+            rc.update((record["id"], record) for record in json.load(f))
+    assert sorted(rc) == sorted(index["types"]["rc"])
+    for passage in passages:
+        assert {rc[question_id]["passage"] for question_id in passage["questions"]} == {passage["id"]}
+        with open(tmp_path / passage["shard"], encoding="utf-8") as f:
+            shard_ids = {record["id"] for record in json.load(f)}
+        assert set(passage["questions"]) <= shard_ids
+        # Questions of a passage stay contiguous in the type order
+        start = index["types"]["rc"].index(passage["questions"][0])
+        assert index["types"]["rc"][start:start + len(passage["questions"])] == passage["questions"]
+    assert all(record.get("passage") for record in rc.values())
+
+
+def test_passages_stay_in_one_shard_and_exams_list_their_shards():
+    questions = all_golden_questions()
+    files = build_index(questions, shard_size=10)
+    index = json.loads(files["index.json"])
+    shard_of = {record["id"]: path for path, data in files.items() if path.startswith("questions/")
+                for record in json.loads(data)}
+
+    assert len(index["shards"]["rc"]) > 1
+    for passage in json.loads(files["passages.json"]):
+        assert {shard_of[question_id] for question_id in passage["questions"]} == {passage["shard"]}
+    for exam, ids in index["exams"].items():
+        assert sorted({shard_of[question_id] for question_id in ids}) == index["exam_shards"][exam]
+
+
+def test_answers_are_choice_indices():
+    questions = all_golden_questions()
+    files = build_index(questions, shard_size=10)
+    records = [record for path, data in files.items() if path.startswith("questions/")
+               for record in json.loads(data)]
+    assert len(records) == len(questions)
+    for record in records:
+        if record["answer"] is not None:
+            assert 0 <= record["answer"] < len(record["choices"])
+    assert any(record["answer"] is not None for record in records)
+
+
+def test_inserting_a_question_keeps_other_ids_and_shards():
+    questions = all_golden_questions()
+    new_question = dict(questions[0], question="سؤال جديد", question_number=999)
+    before = build_index(questions, shard_size=10)
+    after = build_index([new_question] + questions, shard_size=10)
+
+    ids_before = json.loads(before["index.json"])["types"]
+    ids_after = json.loads(after["index.json"])["types"]
+    new_ids = [question_id for question_id in ids_after["analogy"] if question_id not in ids_before["analogy"]]
+    assert len(new_ids) == 1 and ids_after["analogy"][0] == new_ids[0]
+    assert ids_after["analogy"][1:] == ids_before["analogy"]
+    assert ids_after["rc"] == ids_before["rc"]
+
+    changed = {path for path in after if path.startswith("questions/") and before.get(path) != after[path]}
+    assert len(changed) == 1
+
+
+def test_repeated_questions_get_distinct_ids():
+    question = all_golden_questions()[0]
+    ids = json.loads(build_index([question, dict(question)])["index.json"])["types"]["analogy"]
+    assert len(set(ids)) == 2 and ids[1] == f"{ids[0]}-2"
+
+
+def test_manifest_hashes_and_incremental_export(tmp_path):
+    questions = all_golden_questions()
+    manifest = export_index(questions, str(tmp_path), shard_size=10)
+    for path, entry in manifest["files"].items():
+        with open(tmp_path / path, "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == entry["sha256"]
+
+    mtimes = {path: os.path.getmtime(tmp_path / path) for path in manifest["files"]}
+    again = export_index(questions, str(tmp_path), shard_size=10)
+    assert again == manifest
+    assert all(os.path.getmtime(tmp_path / path) == mtime for path, mtime in mtimes.items())
+
+    smaller = export_index(questions[:5], str(tmp_path), shard_size=10)
+    stale = set(manifest["files"]) - set(smaller["files"])
+    assert stale and not any(os.path.exists(tmp_path / path) for path in stale)
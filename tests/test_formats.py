@@ -0,0 +1,63 @@
+import io
+import json
+import gzip
+
+import pytest
+
+from formats import FORMATS, available_formats, dump_questions, read_questions, with_format_extension
+
+QUESTIONS = [
+    {"question_number": 1, "question": "ما مرادف «سريع»؟", "choices": ["بطيء", "عاجل"], "answer": "عاجل"},
+    {"question_number": 2, "question": "q2", "choices": [], "answer": None, "passage": "نص\nبسطرين"},
+]
+
+
+def read(data):
+    return read_questions(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("fmt", list(FORMATS))
+def test_every_format_round_trips(fmt):
+    if fmt not in available_formats():
+        pytest.skip(f"{fmt} needs an optional dependency")
+    assert read(dump_questions(QUESTIONS, fmt)) == QUESTIONS
+
+
+def test_reads_json_with_bom():
+    assert read("\ufeff".encode("utf-8") + json.dumps(QUESTIONS, ensure_ascii=False).encode("utf-8")) == QUESTIONS
+
+
+def test_reads_a_pretty_printed_single_object():
+    data = json.dumps(QUESTIONS[0], ensure_ascii=False, indent=2).encode("utf-8")
+    assert read(data) == [QUESTIONS[0]]
+
+
+def test_reads_json_lines_with_blank_lines():
+    lines = [json.dumps(question, ensure_ascii=False) for question in QUESTIONS]
+    assert read(("\n".join(lines) + "\n\n").encode("utf-8")) == QUESTIONS
+
+
+def test_reads_gzip_by_content_not_name():
+    assert read(gzip.compress(json.dumps(QUESTIONS).encode("utf-8"))) == QUESTIONS
+
+
+@pytest.mark.parametrize("data", [b"", b"  \n", b"[]"])
+def test_empty_input_has_no_questions(data):
+    assert read(data) == []
+
+
+@pytest.mark.parametrize("data", [b"123", b'"text"', b"not json"])
+def test_top_level_scalar_is_a_json_error(data):
+    with pytest.raises(ValueError):
+        read(data)
+
+
+@pytest.mark.parametrize("file_name, fmt, expected", [
+    ("bank.JSON.gz", "jsonl", "bank.jsonl"),
+    ("bank.json.gz", "msgpack", "bank.msgpack"),
+    ("Exam.HTML", "json.zst", "Exam.json.zst"),
+    ("a.b.jsonl.zst", "json", "a.b.json"),
+    ("notes", "json.gz", "notes.json.gz"),
+])
+def test_with_format_extension(file_name, fmt, expected):
+    assert with_format_extension(file_name, fmt) == expected
@@ -0,0 +1,30 @@
+import pytest
+
+from harness import (
+    SAMPLES, REFERENCE_ENGINE, engine_names, engines, run_engine, read_sample, load_golden,
+    normalize_whitespace
+)
+
+
+@pytest.mark.parametrize("engine_name", engine_names())
+@pytest.mark.parametrize("sample", SAMPLES, ids=[sample["id"] for sample in SAMPLES])
+def test_engine_matches_golden(engine_name, sample, throughput):
+    engine = engines().get(engine_name)
+    if engine is None:
+        pytest.skip(f"{engine_name} is not installed")
+
+    html_content = read_sample(sample)
+    questions, seconds = run_engine(engine, html_content, sample["category"])
+    golden = load_golden(sample)
+
+    if engine_name == REFERENCE_ENGINE:
+        assert questions == golden
+    else:
+        assert normalize_whitespace(questions) == normalize_whitespace(golden)
+    throughput(engine_name, questions, html_content, seconds)
+
+
+def test_goldens_are_not_empty():
+    for sample in SAMPLES:
+        golden = load_golden(sample)
+        assert golden, sample["id"]
@@ -0,0 +1,56 @@
+import io
+import asyncio
+
+from aiohttp import web
+
+from fake_bot_api import FakeBotAPI
+from loadtest import LoadTest, run_load_test, percentile, print_report
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 95) == 0.0
+
+
+def test_small_load_run_completes(capsys):
+    report = asyncio.run(run_load_test(users=6, merge_ratio=0.5, timeout=60, seed=1))
+
+    assert report["errors"] == {}
+    assert sum(row["count"] for row in report["latency"].values()) == 6
+    assert report["first_reply"]["count"] == 6
+    assert report["api_calls"]["sendDocument"] == 6
+    assert report["loop_lag_ms"]["count"] > 0
+
+
+def test_external_run_with_health_reports_the_bots_lag():
+    health = {"status": "ok", "lag_ms": {"count": 5, "p50": 1.0, "p95": 2.0, "p99": 3.0, "max": 4.0},
+              "stalled_seconds": 0, "stalls": 2, "active_handlers": []}
+
+    async def health_check(request):
+        return web.json_response(health)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/health", health_check)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        try:
+            external = LoadTest(FakeBotAPI(), 0, 0, 0, external=True, health_url=f"http://{host}:{port}/health")
+            without_health = LoadTest(FakeBotAPI(), 0, 0, 0, external=True)
+            return await external.run(), await without_health.run()
+        finally:
+            await runner.cleanup()
+
+    report, without_health = asyncio.run(run())
+
+    assert report["loop_lag_source"] == "bot /health"
+    assert report["loop_lag_ms"] == health["lag_ms"]
+    assert report["loop_stalls"] == 0
+    assert report["peak_rss_mb"] is None
+    assert without_health["loop_lag_ms"] is None and without_health["peak_rss_mb"] is None
+    print_report(without_health, io.StringIO())
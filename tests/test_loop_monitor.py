@@ -0,0 +1,49 @@
+import time
+import asyncio
+import logging
+
+from loop_monitor import LoopLagMonitor
+
+
+def test_watchdog_logs_blocking_handler(caplog):
+    monitor = LoopLagMonitor(interval=0.01, degraded_ms=100, watchdog_threshold=0.1)
+
+    @monitor.watched
+    async def blocking_handler():
+        time.sleep(0.4)  # a synchronous call that holds the loop
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        assert monitor.health()["status"] == "ok"
+        await blocking_handler()
+        await asyncio.sleep(0.05)
+        health = monitor.health()
+        await monitor.stop()
+        return health
+
+    with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+        health = asyncio.run(scenario())
+
+    assert monitor.stalls == 1
+    assert health["status"] == "degraded"
+    assert health["lag_ms"]["max"] >= 250
+    assert health["active_handlers"] == []
+    [record] = caplog.records
+    assert "blocking_handler" in record.getMessage()
+    assert "time.sleep" in record.getMessage()
+
+
+def test_sync_functions_are_tracked():
+    monitor = LoopLagMonitor()
+    seen = []
+
+    @monitor.watched
+    def merge():
+        seen.extend(monitor.active_handlers())
+        return 42
+
+    assert merge() == 42
+    assert seen[0].startswith("test_sync_functions_are_tracked.<locals>.merge")
+    assert monitor.active == {}
+    assert monitor.health()["status"] == "ok"
@@ -0,0 +1,47 @@
+from normalize import normalize, normalize_many, annotate_answers, LIGHT, FULL, SEPARATOR
+from merging import MergeAccumulator
+
+
+def test_normalize_tables():
+    assert normalize("مُـــدَرِّسَة   أولى‏", LIGHT) == "مُدَرِّسَة أولى"
+    assert normalize("مُـــدَرِّسَة   أولى‏", FULL) == "مدرسة اولى"
+    assert normalize("السؤال ١٢ و ۳", FULL) == "السؤال 12 و 3"
+
+
+def test_batch_matches_single_pass():
+    texts = ["  إِلى  ", "", "بحرـ", f"a{SEPARATOR}b", "x"]
+    assert normalize_many(texts) == [normalize(text) for text in texts]
+    assert normalize_many([]) == []
+
+
+def test_annotate_answers():
+    questions = [
+        # Diacritics distinguish the choices: exact (LIGHT) match wins
+        {"choices": ["عَلِمَ", "عُلِمَ", "كتاب"], "answer": "عُلِمَ"},
+        # Answer differs from its choice by tatweel and alef form
+        {"choices": ["علم", "إسلام"], "answer": "اسـلام"},
+        # Duplicate choices that differ only by spacing and invisible marks are dropped
+        {"choices": ["بحر", " بحر‏", "نهر"], "answer": "نهر"},
+        # Ambiguous or missing answers stay unresolved
+        {"choices": ["عَلِمَ", "عُلِمَ"], "answer": "علم"},
+        {"choices": ["بحر"], "answer": ""},
+    ]
+    annotate_answers(questions)
+    assert [q["answer_index"] for q in questions] == [1, 1, 1, None, None]
+    assert questions[2]["choices"] == ["بحر", "نهر"]
+
+
+def test_merge_key_ignores_tatweel_and_spacing():
+    accumulator = MergeAccumulator()
+    accumulator.add_questions([{"question": "ما مرادف  بحر", "choices": ["يم", "نهر"]}])
+    stats = accumulator.add_questions([{"question": "ما مرادف بـحر", "choices": ["يم ", "نهر"]}])
+    assert stats["duplicates"] == 1
+
+
+def test_batched_merge_keys_match_single_keys():
+    questions = [
+        {"question": "ما مرادف  بحر", "choices": ["يم", "نهر"], "passage": "نص"},
+        {"question": "سؤال", "choices": []},
+        {"question": f"فاصل{SEPARATOR}داخل النص", "choices": ["أ", None]},
+    ]
+    assert MergeAccumulator.question_keys(questions) == [MergeAccumulator.question_key(q) for q in questions]
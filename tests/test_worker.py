@@ -0,0 +1,176 @@
+import io
+import json
+import asyncio
+
+from backends import MemorySessionStore, MemoryJobQueue, MemoryBlobStore
+from delivery import DeliveryQueue
+from formats import dump_questions, read_questions
+from harness import SAMPLES, read_sample, load_golden
+from worker import ParseWorker, session_key
+from fake_bot import FakeBot
+
+
+def run_jobs(jobs, sessions, blobs, **worker_options):
+    """Drain the queue with one worker and return the fake bot"""
+    fake_bot = FakeBot()
+
+    async def drain():
+        outbox = DeliveryQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        outbox.start(fake_bot)
+        worker = ParseWorker(jobs, sessions, blobs, outbox, **worker_options)
+        while True:
+            job = jobs.claim()
+            if job is None:
+                break
+            await worker.process(job)
+        await outbox.stop()
+
+    asyncio.run(drain())
+    return fake_bot
+
+
+def test_extract_job_sends_questions():
+    sample = SAMPLES[0]
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(), MemoryBlobStore()
+    blob_key = blobs.put(read_sample(sample).encode("utf-8"))
+    jobs.put({
+        "type": "extract", "chat_id": 7, "message_id": 1, "blob_key": blob_key,
+        "file_name": sample["html"], "category": sample["category"], "format": "jsonl.gz"
+    }, group="7")
+
+    fake_bot = run_jobs(jobs, sessions, blobs)
+
+    [document] = fake_bot.documents()
+    assert document["filename"].endswith(".jsonl.gz")
+    assert read_questions(io.BytesIO(document["document"])) == load_golden(sample)
+    assert blobs.blobs == {}
+    assert jobs.pending_count() == 0
+
+
+def test_extract_job_reports_progress_and_preview():
+    sample = SAMPLES[0]
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(), MemoryBlobStore()
+    blob_key = blobs.put(read_sample(sample).encode("utf-8"))
+    jobs.put({
+        "type": "extract", "chat_id": 7, "message_id": 1, "blob_key": blob_key,
+        "file_name": sample["html"], "category": sample["category"], "format": "json"
+    }, group="7")
+
+    fake_bot = run_jobs(jobs, sessions, blobs, progress_interval=0.001, preview_questions=3)
+
+    golden = load_golden(sample)
+    [preview] = fake_bot.texts("send_message")
+    assert all(question["question"] in preview for question in golden[:3])
+    assert golden[3]["question"] not in preview
+
+    edits = fake_bot.texts("edit_message_text")
+    assert any("%" in text for text in edits[:-1])
+    assert "✅" in edits[-1]
+    [document] = fake_bot.documents()
+    assert json.loads(document["document"]) == golden
+
+
+def test_merge_jobs_fold_in_order_and_finalize():
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(), MemoryBlobStore()
+    sessions.set(session_key(7), {"mode": "merge", "merge_id": "m1"})
+    first = [{"question": f"q{i}", "choices": ["a", "b"], "answer": "a"} for i in range(3)]
+    second = first[1:] + [{"question": "new", "choices": ["a"], "answer": "a"}]
+    for name, questions, fmt in (("a.json", first, "json"), ("b.json", second, "compact")):
+        blob_key = blobs.put(dump_questions(questions, fmt))
+        jobs.put({"type": "merge_file", "chat_id": 7, "merge_id": "m1", "blob_key": blob_key,
+                  "file_name": name}, group="7")
+    jobs.put({"type": "merge_finalize", "chat_id": 7, "message_id": 1, "merge_id": "m1",
+              "format": "json"}, group="7")
+
+    fake_bot = run_jobs(jobs, sessions, blobs)
+
+    [document] = fake_bot.documents()
+    merged = json.loads(document["document"])
+    assert [q["question"] for q in merged] == ["q0", "q1", "q2", "new"]
+    assert [q["question_number"] for q in merged] == [1, 2, 3, 4]
+    replies = fake_bot.texts("send_message")
+    assert len(replies) == 2 and "♻️" in replies[1]
+    assert sessions.get(session_key(7)) is None
+    assert blobs.blobs == {}
+
+
+def test_upload_after_cancel_is_dropped():
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(), MemoryBlobStore()
+    blob_key = blobs.put(dump_questions([{"question": "q", "choices": []}]))
+    jobs.put({"type": "merge_file", "chat_id": 7, "merge_id": "gone", "blob_key": blob_key,
+              "file_name": "a.json"}, group="7")
+
+    fake_bot = run_jobs(jobs, sessions, blobs)
+
+    assert fake_bot.calls == []
+    assert blobs.blobs == {}
+
+
+def test_merge_folds_write_only_the_new_file_and_resume_in_another_worker():
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(), MemoryBlobStore()
+    sessions.set(session_key(7), {"mode": "merge", "merge_id": "m1"})
+    files = [[{"question": f"q{i}", "choices": ["a", "b"]} for i in range(n, n + 3)] for n in (0, 2, 4)]
+
+    def upload(name, questions):
+        jobs.put({"type": "merge_file", "chat_id": 7, "merge_id": "m1",
+                  "blob_key": blobs.put(dump_questions(questions, "json")), "file_name": name}, group="7")
+
+    upload("a.json", files[0])
+    upload("b.json", files[1])
+    run_jobs(jobs, sessions, blobs)
+    first_record = blobs.blobs["merge-m1-0.json"]
+    assert json.loads(blobs.blobs["merge-m1.json"])["files"] == ["a.json", "b.json"]
+    assert len(json.loads(blobs.blobs["merge-m1-1.json"])["questions"]) == 2
+
+    # A fresh worker replays the stored records and folds the third file on top
+    upload("c.json", files[2])
+    run_jobs(jobs, sessions, blobs)
+    assert blobs.blobs["merge-m1-0.json"] == first_record
+    assert len(json.loads(blobs.blobs["merge-m1-2.json"])["questions"]) == 2
+
+    jobs.put({"type": "merge_finalize", "chat_id": 7, "message_id": 1, "merge_id": "m1",
+              "format": "json"}, group="7")
+    fake_bot = run_jobs(jobs, sessions, blobs)
+
+    [document] = fake_bot.documents()
+    assert [q["question"] for q in json.loads(document["document"])] == [f"q{i}" for i in range(7)]
+    [result] = fake_bot.texts("edit_message_text")
+    assert "أسئلة مكررة تم حذفها: 2" in result
+    assert blobs.blobs == {}
+
+
+def test_redelivered_merge_file_is_folded_once():
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(), MemoryBlobStore()
+    sessions.set(session_key(7), {"mode": "merge", "merge_id": "m1"})
+    payload = {"type": "merge_file", "chat_id": 7, "merge_id": "m1", "file_name": "a.json",
+               "blob_key": blobs.put(dump_questions([{"question": "q", "choices": ["a"]}]))}
+    worker = ParseWorker(jobs, sessions, blobs, DeliveryQueue())
+    # The worker died after storing the fold, before the upload blob was deleted and the job acked
+    blob = blobs.get(payload["blob_key"])
+    worker.fold_merge_file("m1", "a.json", payload["blob_key"], [{"question": "q", "choices": ["a"]}])
+    assert blobs.get(payload["blob_key"]) == blob
+    jobs.put(payload, group="7")
+
+    fake_bot = run_jobs(jobs, sessions, blobs)
+
+    assert fake_bot.calls == []
+    assert json.loads(blobs.blobs["merge-m1.json"])["files"] == ["a.json"]
+    assert payload["blob_key"] not in blobs.blobs
+
+
+def test_long_job_keeps_its_lease():
+    sessions, jobs, blobs = MemorySessionStore(), MemoryJobQueue(lease_seconds=0.15), MemoryBlobStore()
+    jobs.put({"type": "slow"}, group="7")
+
+    class SlowWorker(ParseWorker):
+        async def handle_slow(self, job):
+            await asyncio.sleep(0.5)
+            self.claimed_meanwhile = await asyncio.to_thread(jobs.claim)
+
+    async def run():
+        worker = SlowWorker(jobs, sessions, blobs, DeliveryQueue())
+        await worker.process(jobs.claim())
+        return worker.claimed_meanwhile
+
+    assert asyncio.run(run()) is None
+    assert jobs.pending_count() == 0
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Parse Worker
+عامل معالجة يستلم المهام من الطابور المشترك ويرسل النتائج للمستخدم
+
+Runs inside bot.py by default (BOT_MODE=all). To scale out, run the bot with
+BOT_MODE=frontend and any number of `python worker.py` processes that share
+STATE_DB and BLOB_DIR. Separate workers never call Telegram: their messages go
+through the shared outbound queue and the front end sends them, so one process
+owns the rate limits and the order of each chat's messages.
+"""
+
+import io
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+from parse_html import HTMLResultsParser
+from merging import MergeAccumulator
+from normalize import annotate_answers
+from delivery import StoredOutbox
+from formats import FORMATS, dump_questions, read_questions, with_format_extension
+from backends import FileBlobStore, BLOB_DIR, create_stores, create_message_queue, is_shared
+from loop_monitor import monitor, watched
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 0.2))
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 1))
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 2.0))  # seconds between progress edits
+PREVIEW_QUESTIONS = int(os.getenv('PREVIEW_QUESTIONS', 0))  # questions sent as a preview, 0 = off
+PREVIEW_MAX_CHARS = 4000
+MERGE_CACHE_SIZE = int(os.getenv('MERGE_CACHE_SIZE', 32))  # merges kept in memory per worker
+
+
+def progress_text(questions: int, done: int, total: int) -> str:
+    percent = int(done * 100 / total) if total else 0
+    return (
+        "⏳ جاري معالجة الملف...\n\n"
+        f"• الأسئلة المستخرجة: {questions}\n"
+        f"• التقدم: {percent}%"
+    )
+
+
+def preview_text(questions: List[Dict[str, Any]]) -> str:
+    """Short text preview of the first questions, kept under Telegram's message size limit"""
+    lines = [f"👀 معاينة أول {len(questions)} أسئلة (الملف الكامل قيد التجهيز):", ""]
+    for question in questions:
+        lines.append(f"{question.get('question_number')}. {question.get('question', '')}")
+        answer = question.get('answer')
+        if answer:
+            lines.append(f"   ✅ {answer}")
+    text = "\n".join(lines)
+    return text if len(text) <= PREVIEW_MAX_CHARS else text[:PREVIEW_MAX_CHARS - 1] + "…"
+
+
+def session_key(user_id: int) -> str:
+    return f"session:{user_id}"
+
+
+def merge_state_key(merge_id: str) -> str:
+    """Small head blob listing the files sources into a merge"""
+    return f"merge-{merge_id}.json"
+
+
+def merge_record_key(merge_id: str, n: int) -> str:
+    """Questions and dedup keys added by the n-th sources file"""
+    return f"merge-{merge_id}-{n}.json"
+
+
+def encode_state(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def delete_merge_state(blobs, merge_id: str):
+    """Delete a merge's head blob and every file record it lists"""
+    try:
+        count = len(json.loads(blobs.get(merge_state_key(merge_id)))['files'])
+    except KeyError:
+        return
+    for n in range(count):
+        blobs.delete(merge_record_key(merge_id, n))
+    blobs.delete(merge_state_key(merge_id))
+
+
+class ParseWorker:
+    """Claim jobs from the shared queue, parse or merge, and deliver the results"""
+
+    def __init__(self, jobs, sessions, blobs, outbox, poll_interval: float = POLL_INTERVAL,
+                 progress_interval: float = PROGRESS_INTERVAL, preview_questions: int = PREVIEW_QUESTIONS):
+        self.jobs = jobs
+        self.sessions = sessions
+        self.blobs = blobs
+        self.outbox = outbox  # DeliveryQueue in the bot process, StoredOutbox in worker.py
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.preview_questions = preview_questions
+        self.merges: OrderedDict = OrderedDict()  # merge_id -> (accumulator, files, sources), kept between folds
+        self.stopping = False
+
+    async def run(self):
+        """Process jobs until stop() is called"""
+        while not self.stopping:
+            job = await asyncio.to_thread(self.jobs.claim)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.process(job)
+
+    def stop(self):
+        self.stopping = True
+
+    @watched
+    async def process(self, job: Dict[str, Any]):
+        """Run one job and ack it, or release it for a retry on failure"""
+        payload = job['payload']
+        handler = getattr(self, f"handle_{payload.get('type')}", None)
+        if handler is None:
+            logger.error(f"Unknown job type: {payload.get('type')}")
+            await asyncio.to_thread(self.jobs.ack, job['id'])
+            return
+
+        heartbeat = asyncio.create_task(self.keep_leased(job['id']))
+        try:
+            await handler(payload)
+            # The job's messages must be queued before it is gone
+            await self.outbox.flush()
+            await asyncio.to_thread(self.jobs.ack, job['id'])
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.jobs.fail, job['id'])
+            raise
+        except Exception as e:
+            logger.error(f"Error processing {payload['type']} job (attempt {job['attempts']}): {e}")
+            if not await asyncio.to_thread(self.jobs.fail, job['id']) and payload.get('message_id'):
+                self.outbox.edit_message_text(payload['chat_id'], payload['message_id'], "❌ حدث خطأ في معالجة الملف")
+        finally:
+            heartbeat.cancel()
+
+    async def keep_leased(self, job_id: str):
+        """Renew the job's lease while it runs, so a long parse is not claimed by a second worker"""
+        while True:
+            await asyncio.sleep(self.jobs.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.jobs.extend, job_id)
+            except Exception as e:
+                logger.error(f"Error extending the lease of job {job_id}: {e}")
+
+    async def handle_extract(self, job: Dict[str, Any]):
+        """Parse an uploaded HTML page and send the questions file"""
+        chat_id = job['chat_id']
+        message_id = job['message_id']
+        category = job['category']
+        fmt = job['format']
+
+        try:
+            html_content = (await asyncio.to_thread(self.blobs.get, job['blob_key'])).decode('utf-8')
+        except KeyError:
+            self.outbox.edit_message_text(chat_id, message_id, "❌ انتهت صلاحية الجلسة. يرجى إرسال الملف مرة أخرى")
+            return
+
+        # Create new parser instance for each file to avoid merging
+        parser = HTMLResultsParser()
+        questions = await self.parse_with_progress(parser, html_content, category, chat_id, message_id)
+
+        if not questions:
+            self.outbox.edit_message_text(chat_id, message_id, "❌ لم يتم العثور على أسئلة في الملف")
+            await asyncio.to_thread(self.blobs.delete, job['blob_key'])
+            return
+
+        # Generate output filename
+        output_filename = with_format_extension(job['file_name'], fmt)
+
+        # Serialize questions in the chosen format
+        output_data = await asyncio.to_thread(dump_questions, questions, fmt)
+
+        # Send results
+        result_text = f"""
+✅ تم استخراج الأسئلة بنجاح!
+
+📊 إحصائيات:
+• عدد الأسئلة: {len(questions)}
+• نوع القسم: {category}
+• صيغة الملف: {FORMATS[fmt]['label']}
+• اسم الملف: {output_filename}
+            """
+
+        self.outbox.edit_message_text(chat_id, message_id, result_text)
+
+        # Queue output file
+        self.outbox.send_document(
+            chat_id,
+            output_data,
+            filename=output_filename,
+            caption=f"📄 ملف الأسئلة المستخرجة - {category}"
+        )
+
+        await asyncio.to_thread(self.blobs.delete, job['blob_key'])
+
+    async def parse_with_progress(self, parser: HTMLResultsParser, html_content: str, category: str,
+                                  chat_id: int, message_id: int) -> List[Dict[str, Any]]:
+        """Parse in a thread while editing the status message with live progress and sending a preview"""
+        def parse():
+            try:
+                for _ in parser.iter_questions(html_content, category):
+                    pass
+            except Exception as e:
+                logger.error(f"Error parsing HTML content: {e}")
+            return annotate_answers(parser.questions)
+
+        task = asyncio.ensure_future(asyncio.to_thread(parse))
+        last_text = None
+        preview_sent = self.preview_questions <= 0
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=self.progress_interval)
+            if done:
+                return task.result()
+
+            if not preview_sent and len(parser.questions) >= self.preview_questions:
+                # Copies, so the parser thread keeps its own dicts
+                preview = annotate_answers([dict(q) for q in parser.questions[:self.preview_questions]])
+                self.outbox.send_message(chat_id, preview_text(preview))
+                preview_sent = True
+
+            text = progress_text(len(parser.questions), parser.containers_done, parser.containers_total)
+            if text != last_text:
+                # Edits share one delivery key, so a slow chat only gets the latest progress
+                self.outbox.edit_message_text(chat_id, message_id, text)
+                last_text = text
+
+    def load_merge(self, merge_id: str) -> Tuple[MergeAccumulator, List[str], List[str]]:
+        """Merge state and the upload blobs folded into it, replaying only records this worker has not seen yet"""
+        head = self.read_merge_head(merge_id)
+        head_sources = head.get('sources') or [None] * len(head['files'])
+        accumulator, files, sources = self.merges.pop(merge_id, None) or (MergeAccumulator(), [], [])
+        if len(files) > len(head['files']):
+            # State was deleted and started again; rebuild from the records
+            accumulator, files, sources = MergeAccumulator(), [], []
+        for n in range(len(files), len(head['files'])):
+            accumulator.add_record(json.loads(self.blobs.get(merge_record_key(merge_id, n))))
+            files.append(head['files'][n])
+            sources.append(head_sources[n])
+
+        # Most recently used last; drop the oldest cached merges
+        self.merges[merge_id] = (accumulator, files, sources)
+        while len(self.merges) > MERGE_CACHE_SIZE:
+            self.merges.popitem(last=False)
+        return accumulator, files, sources
+
+    def read_merge_head(self, merge_id: str) -> Dict[str, Any]:
+        try:
+            return json.loads(self.blobs.get(merge_state_key(merge_id)))
+        except KeyError:
+            return {'files': [], 'sources': []}
+
+    def fold_merge_file(self, merge_id: str, file_name: str, blob_key: str,
+                        questions: list) -> Tuple[Dict[str, int], int, int]:
+        """Fold one file into the merge; writes only that file's record and the small head blob"""
+        try:
+            accumulator, files, sources = self.load_merge(merge_id)
+            start = len(accumulator.questions)
+            stats = accumulator.add_questions(questions)
+            record = accumulator.record_since(start, stats)
+            self.blobs.put(encode_state(record), key=merge_record_key(merge_id, len(files)))
+            files.append(file_name)
+            sources.append(blob_key)
+            self.blobs.put(encode_state({'files': files, 'sources': sources}), key=merge_state_key(merge_id))
+        except Exception:
+            # The cached state may be ahead of the stored one
+            self.merges.pop(merge_id, None)
+            raise
+        return stats, len(files), len(accumulator.questions)
+
+    def delete_merge(self, merge_id: str):
+        self.merges.pop(merge_id, None)
+        delete_merge_state(self.blobs, merge_id)
+
+    async def handle_merge_file(self, job: Dict[str, Any]):
+        """Parse one uploaded question file and fold it into the merge session"""
+        chat_id = job['chat_id']
+        file_name = job['file_name']
+
+        session = await asyncio.to_thread(self.sessions.get, session_key(chat_id))
+        if not session or session.get('merge_id') != job['merge_id']:
+            # Merge was cancelled or finished before this upload was processed
+            await asyncio.to_thread(self.blobs.delete, job['blob_key'])
+            return
+
+        head = await asyncio.to_thread(self.read_merge_head, job['merge_id'])
+        if job['blob_key'] in head.get('sources', []):
+            # Redelivered after the fold was stored but before the job was acked
+            logger.info(f"Upload {job['blob_key']} is already part of merge {job['merge_id']}")
+            await asyncio.to_thread(self.blobs.delete, job['blob_key'])
+            return
+
+        try:
+            data = await asyncio.to_thread(self.blobs.get, job['blob_key'])
+            questions = await asyncio.to_thread(read_questions, io.BytesIO(data))
+        except Exception as e:
+            logger.error(f"Error reading file {file_name}: {e}")
+            self.outbox.send_message(chat_id, f"❌ تعذر قراءة الملف: {file_name}")
+            await asyncio.to_thread(self.blobs.delete, job['blob_key'])
+            return
+
+        stats, files_count, questions_count = await asyncio.to_thread(
+            self.fold_merge_file, job['merge_id'], file_name, job['blob_key'], questions
+        )
+        await asyncio.to_thread(self.blobs.delete, job['blob_key'])
+
+        session = await asyncio.to_thread(self.sessions.get, session_key(chat_id))
+        if not session or session.get('merge_id') != job['merge_id']:
+            # Cancelled while this file was being parsed
+            await asyncio.to_thread(self.delete_merge, job['merge_id'])
+            return
+
+        text = (
+            f"✅ تم إضافة الملف: {file_name}\n"
+            f"📥 أسئلة جديدة: {stats['added']}\n"
+        )
+        if stats['duplicates']:
+            text += f"♻️ أسئلة مكررة تم تجاهلها: {stats['duplicates']}\n"
+        if stats['invalid']:
+            text += f"⚠️ عناصر غير صالحة: {stats['invalid']}\n"
+        text += (
+            f"📊 إجمالي الملفات: {files_count}\n"
+            f"📊 إجمالي الأسئلة: {questions_count}"
+        )
+        self.outbox.send_message(chat_id, text)
+
+    async def handle_merge_finalize(self, job: Dict[str, Any]):
+        """Serialize the merged questions and send them; uploads were sources as they arrived"""
+        chat_id = job['chat_id']
+        message_id = job['message_id']
+        fmt = job['format']
+
+        session = await asyncio.to_thread(self.sessions.get, session_key(chat_id))
+        if not session or session.get('merge_id') != job['merge_id']:
+            self.outbox.edit_message_text(chat_id, message_id, "❌ لا توجد جلسة دمج نشطة")
+            return
+
+        accumulator, files, _ = await asyncio.to_thread(self.load_merge, job['merge_id'])
+
+        if len(files) < 2:
+            self.outbox.edit_message_text(chat_id, message_id, "❌ تحتاج إلى ملفين JSON على الأقل للدمج")
+            return
+
+        merged_questions = accumulator.result()
+        if not merged_questions:
+            self.outbox.edit_message_text(chat_id, message_id, "❌ فشل في دمج الملفات")
+            return
+
+        # Generate output filename
+        output_filename = f"merged_questions_{len(merged_questions)}_questions{FORMATS[fmt]['extension']}"
+
+        # Serialize merged questions in the chosen format
+        output_data = await asyncio.to_thread(dump_questions, merged_questions, fmt)
+
+        # Send results
+        result_text = f"""
+✅ تم دمج الملفات بنجاح!
+
+📊 إحصائيات:
+• عدد الملفات المدمجة: {len(files)}
+• إجمالي الأسئلة: {len(merged_questions)}
+• أسئلة مكررة تم حذفها: {accumulator.duplicates}
+• صيغة الملف: {FORMATS[fmt]['label']}
+• اسم الملف: {output_filename}
+
+📝 الملفات المدمجة:
+{chr(10).join([f"• {file}" for file in files])}
+            """
+
+        self.outbox.edit_message_text(chat_id, message_id, result_text)
+
+        # Queue merged output file
+        self.outbox.send_document(
+            chat_id,
+            output_data,
+            filename=output_filename,
+            caption=f"📄 ملف الأسئلة المدمجة - {len(merged_questions)} سؤال"
+        )
+
+        # Clean up the merge session
+        await asyncio.to_thread(self.delete_merge, job['merge_id'])
+        session = await asyncio.to_thread(self.sessions.get, session_key(chat_id))
+        if session and session.get('merge_id') == job['merge_id']:
+            await asyncio.to_thread(self.sessions.delete, session_key(chat_id))
+
+
+def main():
+    """Run standalone worker processes against the shared stores"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    if not is_shared():
+        logger.error("STATE_DB and BLOB_DIR must be set to run a separate worker")
+        return
+
+    async def run_workers():
+        # The front end relays these messages to Telegram
+        outbox = StoredOutbox(create_message_queue(), FileBlobStore(BLOB_DIR))
+        monitor.start()
+
+        workers = []
+        for _ in range(WORKER_CONCURRENCY):
+            sessions, jobs, blobs = create_stores()
+            workers.append(ParseWorker(jobs, sessions, blobs, outbox))
+        logger.info(f"Starting {len(workers)} parse workers...")
+
+        try:
+            await asyncio.gather(*(worker.run() for worker in workers))
+        finally:
+            await outbox.flush()
+            await monitor.stop()
+
+    asyncio.run(run_workers())
+
+
+if __name__ == "__main__":
+    main()